@@ -1,22 +1,67 @@
 import reflex as rx
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
+import io
+import re
 import base64
-import tempfile
 import json
 import asyncio
 import time
+import atexit
+import logging
+import logging.handlers
+import queue
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
+import httpx
+import msgspec
+from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+if not logger.handlers:
+    # Ausgabe über einen Hintergrund-Thread, damit Event-Handler nicht auf stdout warten
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_listener = logging.handlers.QueueListener(log_queue, console_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
 
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
 from .bpmn_generator import BPMNGenerator, InterviewAgents
+from .mermaid_export import bpmn_to_mermaid
 from . import db
+from .db_pool import async_pool_lifespan
+
+
+# Ein Client pro Schlüssel, damit parallele Agenten-Aufrufe Keep-Alive-Verbindungen teilen
+@lru_cache(maxsize=8)
+def get_openai_client(api_key: str) -> OpenAI:
+    return OpenAI(
+        api_key=api_key,
+        # SDK-Standardclient (Redirects, Timeouts); nur der Keep-Alive-Pool wird angepasst
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=DEFAULT_CONNECTION_LIMITS.max_connections,
+                max_keepalive_connections=32,
+            ),
+        ),
+    )
+
 
+@lru_cache(maxsize=1)
+def get_interview_agents(api_key: str) -> InterviewAgents:
+    return InterviewAgents(get_openai_client(api_key))
 
+
+@lru_cache(maxsize=None)
 def load_json_config(filename: str) -> Dict[str, Any]:
     config_path = Path(__file__).parent / "config" / filename
     with open(config_path, "r", encoding="utf-8") as f:
@@ -25,6 +70,88 @@ def load_json_config(filename: str) -> Dict[str, Any]:
 PROCESS_INFO = load_json_config("process-info.json")
 TOPIC_DEFS = load_json_config("topics.json")["topics"]
 TOPIC_TITLES = {topic["key"]: topic["title"] for topic in TOPIC_DEFS}
+DEFAULT_PROCESS_CONTEXT = "Handwerklicher Geschäftsprozess"
+PROCESS_CONTEXT_BY_TYPE = {
+    process_type: info.get("context", DEFAULT_PROCESS_CONTEXT)
+    for process_type, info in PROCESS_INFO.items()
+}
+
+BPMN_VIEWER_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+    <head>
+        <link rel="stylesheet" href="https://unpkg.com/bpmn-js@18.3.1/dist/assets/bpmn-js.css" />
+        <script src="https://unpkg.com/bpmn-js@18.3.1/dist/bpmn-navigated-viewer.development.js"></script>
+        <style>
+            html, body {{
+                margin: 0;
+                padding: 0;
+                overflow: hidden;
+                width: 100%;
+                height: 100%;
+            }}
+            #canvas {{
+                width: 100%;
+                height: 100%;
+                background: white;
+            }}
+            .bjs-container {{
+                width: 100% !important;
+                height: 100% !important;
+            }}
+        </style>
+    </head>
+    <body>
+        <div id="canvas"></div>
+        <script>
+            (async function(){{
+                var viewer = new BpmnJS({{ container: '#canvas' }});
+                var bpmn = `{bpmn}`;
+                try {{
+                    await viewer.importXML(bpmn);
+                    var canvas = viewer.get('canvas');
+                    canvas.zoom('fit-viewport', 'auto');
+                }} catch (err) {{
+                    console.error('Error loading BPMN:', err);
+                    document.body.innerHTML = '<p style="padding: 1rem; color: red;">Fehler beim Laden des Diagramms</p>';
+                }}
+            }})();
+        </script>
+    </body>
+</html>
+'''
+
+
+# Escaping für die Einbettung in ein JavaScript-Template-Literal
+TEMPLATE_LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '`': '\\`', '$': '\\$'})
+
+
+@lru_cache(maxsize=2)
+def render_bpmn_viewer_html(bpmn_xml: str) -> str:
+    escaped_bpmn = bpmn_xml.translate(TEMPLATE_LITERAL_ESCAPES)
+    return BPMN_VIEWER_TEMPLATE.format(bpmn=escaped_bpmn)
+
+
+class AudioPayload(msgspec.Struct, rename="camel"):
+    audio_data: str = ""
+    mime_type: str = "audio/webm"
+    error: Optional[str] = None
+
+
+# Referenzen halten, damit laufende Speicher-Tasks nicht eingesammelt werden
+DB_SAVE_TASKS: set = set()
+
+
+def log_db_save_result(task: asyncio.Task) -> None:
+    DB_SAVE_TASKS.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.warning("Could not save to database: %s", error)
+    elif task.result() is not None:
+        logger.info("BPMN generation saved to database")
+
 
 class BPMNState(rx.State):
     process_type: str = ""
@@ -39,6 +166,7 @@ class BPMNState(rx.State):
     topic_history: Dict[str, List[Dict[str, Any]]] = {}
     topics_completed: List[str] = []
     bpmn_xml: str = ""
+    mermaid_code: str = ""
     active_tab: str = "input"
     active_info_tab: str = "funktioniert"
     is_loading: bool = False
@@ -57,51 +185,7 @@ class BPMNState(rx.State):
     def bpmn_viewer_html(self) -> str:
         if not self.bpmn_xml:
             return ""
-        escaped_bpmn = self.bpmn_xml.replace('`', '\\`')
-        return f'''
-        <!DOCTYPE html>
-        <html>
-            <head>
-                <link rel="stylesheet" href="https://unpkg.com/bpmn-js@18.3.1/dist/assets/bpmn-js.css" />
-                <script src="https://unpkg.com/bpmn-js@18.3.1/dist/bpmn-navigated-viewer.development.js"></script>
-                <style>
-                    html, body {{
-                        margin: 0;
-                        padding: 0;
-                        overflow: hidden;
-                        width: 100%;
-                        height: 100%;
-                    }}
-                    #canvas {{
-                        width: 100%;
-                        height: 100%;
-                        background: white;
-                    }}
-                    .bjs-container {{
-                        width: 100% !important;
-                        height: 100% !important;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div id="canvas"></div>
-                <script>
-                    (async function(){{
-                        var viewer = new BpmnJS({{ container: \'#canvas\' }});
-                        var bpmn = `{escaped_bpmn}`;
-                        try {{
-                            await viewer.importXML(bpmn);
-                            var canvas = viewer.get(\'canvas\');
-                            canvas.zoom(\'fit-viewport\', \'auto\');
-                        }} catch (err) {{
-                            console.error(\'Error loading BPMN:\', err);
-                            document.body.innerHTML = \'<p style="padding: 1rem; color: red;">Fehler beim Laden des Diagramms</p>\';
-                        }}
-                    }})();
-                </script>
-            </body>
-        </html>
-        '''
+        return render_bpmn_viewer_html(self.bpmn_xml)
 
     def toggle_sidebar(self):
         self.sidebar_open = not self.sidebar_open
@@ -110,8 +194,7 @@ class BPMNState(rx.State):
         self.process_type = value
 
     def get_process_context(self) -> str:
-        info = PROCESS_INFO.get(self.process_type, {})
-        return info.get("context", "Handwerklicher Geschäftsprozess")
+        return PROCESS_CONTEXT_BY_TYPE.get(self.process_type, DEFAULT_PROCESS_CONTEXT)
 
     async def start_interview(self):
         if not self.process_type:
@@ -143,11 +226,12 @@ class BPMNState(rx.State):
             self.generation_step = ""
             return
 
-        agents = InterviewAgents(api_key)
+        agents = get_interview_agents(api_key)
         self.generation_step = "Erste Frage wird vorbereitet..."
         yield
         
-        topic_result = agents.run_topic_manager_agent(
+        topic_result = await asyncio.to_thread(
+            agents.run_topic_manager_agent,
             process_context=process_context,
             summary_text=self.interview_summary,
             topic_defs=TOPIC_DEFS,
@@ -194,7 +278,9 @@ class BPMNState(rx.State):
         base_key = self.current_topic_key
         is_followup = False
         display_question = self.current_question_text
-        self.dialog_history.append({
+        # Verlauf lokal sammeln und nur einmal zuweisen, damit nur ein Delta entsteht
+        new_history = list(self.dialog_history)
+        new_history.append({
             "role": "user",
             "content": answer_text
         })
@@ -209,53 +295,52 @@ class BPMNState(rx.State):
                 self.is_loading = False
                 self.is_saving_answer = False
                 return
-            agents = InterviewAgents(api_key)
+            agents = get_interview_agents(api_key)
             process_context = self.get_process_context()
-            self.generation_step = "Sicherheitsprüfung..."
-            security_result = agents.run_security_agent(
-                self.current_question_text,
-                answer_text,
-                process_context,
-                self.interview_summary
+            self.generation_step = "Antwort wird geprüft und zusammengefasst..."
+            topic_turns = list(self.topic_history.get(base_key, []))
+            topic_turns.append({
+                "question": display_question,
+                "answer": answer_text,
+                "is_followup": is_followup
+            })
+            # Nur bisherige Themen-Zusammenfassung plus neue Antwort senden, damit der Prompt nicht mitwächst
+            latest_turn = f"Frage: {display_question} Antwort: {answer_text}"
+            topic_summary_input = (
+                f"Bisherige Zusammenfassung:\n{self.interview_answers.get(base_key, '')}\n\n"
+                f"Neue Frage: {display_question}\nNeue Antwort: {answer_text}"
             )
-            
+            prev_summary = self.interview_summary
+            agent_results = await agents.run_parallel_agents(
+                question_text=self.current_question_text,
+                answer_text=answer_text,
+                process_context=process_context,
+                summary_text=self.interview_summary,
+                topic_summary_input=topic_summary_input,
+                latest_turn=latest_turn,
+                topic_turns=topic_turns,
+            )
+            security_result = agent_results["security"]
+
             if security_result.get("flagged"):
-                self.dialog_history.append({
+                new_history.append({
                     "role": "assistant",
                     "content": security_result.get("nudge", "Bitte beantworten Sie die Frage zum Prozess.")
                 })
                 self.is_loading = False
                 return
-            if base_key not in self.topic_history:
-                self.topic_history[base_key] = []
-            self.topic_history[base_key].append({
-                "question": display_question,
-                "answer": answer_text,
-                "is_followup": is_followup
-            })
-            self.generation_step = "Antwort wird zusammengefasst..."
-            combined_turns = "\n".join(
-                f"Frage: {item['question']} Antwort: {item['answer']}"
-                for item in self.topic_history[base_key]
-            )
-            summary = agents.summarize_answer(self.current_question_text, combined_turns)
+            self.topic_history = {**self.topic_history, base_key: topic_turns}
+            summary = agent_results["answer_summary"]
+            new_summary = agent_results["new_summary"]
             self.interview_answers[base_key] = summary
-            self.generation_step = "Zusammenfassung wird aktualisiert..."
-            prev_summary = self.interview_summary
-            new_summary = agents.run_summary_agent(
-                self.interview_summary,
-                self.current_question_text,
-                combined_turns,
-                self.topic_history[base_key],
-                process_context
-            )
             if not new_summary.strip():
                 self.interview_summary = prev_summary
             else:
                 self.interview_summary = new_summary
 
             self.generation_step = "Nächste Frage wird vorbereitet..."
-            topic_result = agents.run_topic_manager_agent(
+            topic_result = await asyncio.to_thread(
+                agents.run_topic_manager_agent,
                 process_context=process_context,
                 summary_text=self.interview_summary,
                 topic_defs=TOPIC_DEFS,
@@ -270,7 +355,7 @@ class BPMNState(rx.State):
             if len(self.topics_completed) >= len(TOPIC_DEFS):
                 self.interview_complete = True
                 self.is_interview_active = False
-                self.dialog_history.append({
+                new_history.append({
                     "role": "assistant",
                     "content": "Vielen Dank! Alle Themen sind beantwortet. Klicken Sie auf 'BPMN generieren', um Ihr Prozessdiagramm zu erstellen.",
                     "title": "Interview abgeschlossen"
@@ -281,7 +366,7 @@ class BPMNState(rx.State):
                 topic_title = TOPIC_TITLES.get(self.current_topic_key, "Thema")
                 topic_number = min(len(self.topics_completed) + 1, len(TOPIC_DEFS))
                 self.current_question_title = f"Thema {topic_number} von {len(TOPIC_DEFS)}: {topic_title}"
-                self.dialog_history.append({
+                new_history.append({
                     "role": "assistant",
                     "content": self.current_question_text,
                     "title": self.current_question_title
@@ -290,6 +375,7 @@ class BPMNState(rx.State):
         except Exception as e:
             self.error_message = f"Fehler bei der Verarbeitung: {str(e)}"
         finally:
+            self.dialog_history = new_history
             self.is_loading = False
             self.generation_step = ""
             self.is_saving_answer = False
@@ -332,52 +418,46 @@ class BPMNState(rx.State):
     def update_recording_duration(self, duration: int):
         self.recording_duration = duration
 
+    @rx.event(background=True)
     async def stop_recording_and_transcribe(self, audio_json: str):
-        self.is_recording = False
-        self.recording_duration = 0
-        
-        if not audio_json:
-            self.error_message = "Keine Audiodaten empfangen"
-            return
-            
-        self.is_transcribing = True
-        self.audio_error = ""
-        
-        try:
-            import json
-            try:
-                data = json.loads(audio_json)
-            except json.JSONDecodeError:
-                self.error_message = "Ungültige Audiodaten empfangen"
-                self.is_transcribing = False
-                return
+        async with self:
+            self.is_recording = False
+            self.recording_duration = 0
 
-            if isinstance(data, dict) and data.get("error"):
-                self.error_message = f"Audioaufnahme fehlgeschlagen: {data['error']}"
-                self.is_transcribing = False
-                return
-            
-            audio_base64 = data.get("audioData", "")
-            mime_type = data.get("mimeType", "audio/webm")
-            if not audio_base64:
+            if not audio_json:
                 self.error_message = "Keine Audiodaten empfangen"
-                self.is_transcribing = False
+                self.is_saving_answer = False
                 return
-            audio_bytes = base64.b64decode(audio_base64)
-            transcribed_text = await self._transcribe_audio_whisper(audio_bytes, mime_type)
-            if transcribed_text:
-                self.answer_input = transcribed_text
-                self.is_transcribing = False
-                await self.submit_answer()
+
+            self.is_transcribing = True
+            self.audio_error = ""
+
+        error_message = ""
+        transcribed_text = ""
+        try:
+            payload = await asyncio.to_thread(msgspec.json.decode, audio_json, type=AudioPayload)
+            if payload.error:
+                error_message = f"Audioaufnahme fehlgeschlagen: {payload.error}"
+            elif not payload.audio_data:
+                error_message = "Keine Audiodaten empfangen"
             else:
-                self.error_message = "Transkription fehlgeschlagen - keine Sprache erkannt"
-                self.is_transcribing = False
-                
+                audio_bytes = await asyncio.to_thread(base64.b64decode, payload.audio_data)
+                transcribed_text = await self._transcribe_audio_whisper(audio_bytes, payload.mime_type)
+                if not transcribed_text:
+                    error_message = "Transkription fehlgeschlagen - keine Sprache erkannt"
+        except msgspec.DecodeError:
+            error_message = "Ungültige Audiodaten empfangen"
         except Exception as e:
-            self.error_message = f"Fehler bei der Transkription: {str(e)}"
+            error_message = f"Fehler bei der Transkription: {str(e)}"
+
+        async with self:
             self.is_transcribing = False
-        finally:
-            self.is_saving_answer = False
+            if error_message:
+                self.error_message = error_message
+                self.is_saving_answer = False
+                return
+            self.answer_input = transcribed_text
+        yield BPMNState.submit_answer
 
     def handle_recording_error(self, error: str):
         if not error:
@@ -392,32 +472,23 @@ class BPMNState(rx.State):
         if not api_key:
             raise ValueError("OpenAI API Key nicht konfiguriert")
         
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client(api_key)
         extension = ".webm" if "webm" in mime_type else ".wav"
-        with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as f:
-            f.write(audio_bytes)
-            temp_path = f.name
-        
-        def _do_transcribe(path: str) -> str:
-            with open(path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="de"
-                )
+        audio_file = io.BytesIO(audio_bytes)
+        audio_file.name = f"audio{extension}"
+
+        def _do_transcribe() -> str:
+            transcript = client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                language="de"
+            )
             return transcript.text
 
-        try:
-            transcript_text = await asyncio.wait_for(
-                asyncio.to_thread(_do_transcribe, temp_path),
-                timeout=90,
-            )
-            return transcript_text
-        finally:
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        return await asyncio.wait_for(
+            asyncio.to_thread(_do_transcribe),
+            timeout=90,
+        )
 
     async def generate_bpmn(self):
         self.is_loading = True
@@ -436,25 +507,22 @@ class BPMNState(rx.State):
                 self.is_loading = False
                 return
             process_context = self.get_process_context()
-            context_parts = [f"Prozesstyp: {self.process_type}", f"Kontext: {process_context}", ""]
-            
-            for topic in TOPIC_DEFS:
-                key = topic["key"]
-                if key in self.interview_answers:
-                    context_parts.append(f"Thema: {topic['title']}")
-                    context_parts.append(f"Antwort: {self.interview_answers[key]}")
-                    context_parts.append("")
-            
-            process_description = "\n".join(context_parts)
+            answers = self.interview_answers
+            answered_topics = "\n\n".join(
+                f"Thema: {topic['title']}\nAntwort: {answers[topic['key']]}"
+                for topic in TOPIC_DEFS
+                if topic["key"] in answers
+            )
+            process_description = f"Prozesstyp: {self.process_type}\nKontext: {process_context}\n\n{answered_topics}"
             
             if not process_description.strip():
                 self.error_message = "Keine Prozessbeschreibung vorhanden."
                 self.is_loading = False
                 return
-            generator = BPMNGenerator(api_key)
+            generator = BPMNGenerator(get_openai_client(api_key))
             self.generation_step = "Generiere BPMN-Modell..."
-            print("BPMN prompt start: text_to_model")
-            initial_xml = generator.text_to_model(process_description)
+            logger.info("BPMN prompt start: text_to_model")
+            initial_xml = await asyncio.to_thread(generator.text_to_model, process_description)
             
             if not initial_xml:
                 self.error_message = "Fehler bei der initialen BPMN-Generierung"
@@ -469,12 +537,21 @@ class BPMNState(rx.State):
             
             while issues and improvement_attempts < max_attempts:
                 self.generation_step = f"Verbessere Modell (Versuch {improvement_attempts + 1}/{max_attempts})..."
-                print(f"BPMN prompt start: improve_model attempt {improvement_attempts + 1}/{max_attempts}")
-                improved_xml = generator.improve_model(improved_xml, process_description)
-                issues = generator.check_xml_completeness(improved_xml)
+                logger.info("BPMN prompt start: check_and_improve attempt %d/%d", improvement_attempts + 1, max_attempts)
+                review = await asyncio.to_thread(generator.check_and_improve, improved_xml, process_description, issues)
                 improvement_attempts += 1
-            self.generation_step = "Generiere Diagramm-Layout..."
-            di_xml = generator.generate_bpmn_di(improved_xml)
+                xml_changed = review["xml"] != improved_xml
+                improved_xml = review["xml"]
+                issues = generator.check_xml_completeness(improved_xml)
+                # Nur erneut versuchen, wenn das Modell nichts verändert hat
+                if xml_changed:
+                    break
+            # Nicht parsebares XML kann nicht mit einem Layout zusammengeführt werden
+            if any(issue.startswith("XML Parse Error") for issue in issues):
+                di_xml = ""
+            else:
+                self.generation_step = "Generiere Diagramm-Layout..."
+                di_xml = await asyncio.to_thread(generator.generate_bpmn_di, improved_xml)
             if di_xml:
                 self.generation_step = "Füge Diagramm zusammen..."
                 final_xml = generator.merge_bpmn_xml_diagram(improved_xml, di_xml)
@@ -482,26 +559,23 @@ class BPMNState(rx.State):
                 final_xml = improved_xml
             
             self.bpmn_xml = final_xml
+            self.success_message = "BPMN-Diagramm erfolgreich erstellt!"
             self.generation_step = "Erstelle Visualisierung..."
-            self.mermaid_code = bpmn_to_mermaid(final_xml)
+            self.mermaid_code = bpmn_to_mermaid(final_xml, generator.cached_tree(final_xml))
             generation_duration = time.time() - start_time
-            self.generation_step = "Speichere in Datenbank..."
-            try:
-                db.save_bpmn_generation(
-                    process_type=self.process_type,
-                    ai_model="gpt-5.2",
-                    chat_history=list(self.dialog_history),
-                    interview_summary=self.interview_summary,
-                    bpmn_xml=final_xml,
-                    generation_duration_seconds=generation_duration
-                )
-                print(f"BPMN generation saved to database (duration: {generation_duration:.2f}s)")
-            except Exception as db_error:
-                print(f"Warning: Could not save to database: {db_error}")
+            save_task = asyncio.create_task(db.save_bpmn_generation_async(
+                process_type=self.process_type,
+                ai_model="gpt-5.2",
+                chat_history=[dict(msg) for msg in self.dialog_history],
+                interview_summary=self.interview_summary,
+                bpmn_xml=final_xml,
+                generation_duration_seconds=generation_duration
+            ))
+            DB_SAVE_TASKS.add(save_task)
+            save_task.add_done_callback(log_db_save_result)
             
             self.active_tab = "output"
-            self.success_message = "BPMN-Diagramm erfolgreich erstellt!"
-            print("BPMN model successfully created and visualized")
+            logger.info("BPMN model successfully created and visualized")
             
         except Exception as e:
             self.error_message = f"Fehler bei der BPMN-Generierung: {str(e)}"
@@ -682,82 +756,7 @@ def allgemein_content() -> rx.Component:
         ),
         rx.divider(margin_y="1.5rem"),
         rx.heading("Welche Symbole gibt es?", size="5", color="#0f766e", margin_bottom="1rem", class_name="section-title"),
-        rx.box(
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-start"),
-                    view_box="0 0 36 36",
-                ),
-                "Start-Ereignis",
-                "Markiert den Beginn eines Prozesses",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-end"),
-                    rx.el.circle(cx="18", cy="18", r="9.5", class_name="bpmn-end-outer"),
-                    view_box="0 0 36 36",
-                ),
-                "End-Ereignis",
-                "Markiert das Ende eines Prozesses",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.rect(x="4", y="6", width="28", height="20", rx="3", class_name="bpmn-task"),
-                    view_box="0 0 36 36",
-                ),
-                "Task/Aufgabe",
-                "Eine auszuführende Aktivität",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.rect(x="4", y="8", width="28", height="20", rx="2", class_name="bpmn-message"),
-                    rx.el.path(d="M4 8l14 10 14-10", class_name="bpmn-message"),
-                    view_box="0 0 36 36",
-                ),
-                "Nachricht",
-                "Kommunikation zwischen Beteiligten",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                    rx.el.path(d="M12 12l12 12 M24 12l-12 12", class_name="bpmn-gateway-mark"),
-                    view_box="0 0 36 36",
-                ),
-                "Exklusives Gateway",
-                "Entweder/Oder-Entscheidung",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                    rx.el.path(d="M18 8v20 M8 18h20", class_name="bpmn-gateway-mark"),
-                    view_box="0 0 36 36",
-                ),
-                "Paralleles Gateway",
-                "Parallele Pfade (alle werden ausgeführt)",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.line(x1="4", y1="18", x2="30", y2="18", class_name="bpmn-flow"),
-                    rx.el.polygon(points="30,18 24,14 24,22", class_name="bpmn-flow"),
-                    view_box="0 0 36 36",
-                ),
-                "Sequenzfluss",
-                "Verbindet Elemente im Ablauf",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.path(d="M8 6h16l4 4v16H8z", class_name="bpmn-data"),
-                    rx.el.path(d="M24 6v4h4z", class_name="bpmn-data-fold"),
-                    view_box="0 0 36 36",
-                ),
-                "Datenobjekt",
-                "Daten die im Prozess verwendet werden",
-            ),
-            display="flex",
-            flex_wrap="wrap",
-            gap="1rem",
-            width="100%",
-        ),
+        build_bpmn_legend(),
         align="start",
         width="100%",
     )
@@ -776,11 +775,16 @@ def benefit_item(title: str, description: str) -> rx.Component:
         height="100%",
     )
 
+
+BPMN_ICON_CLASS = "bpmn-icon"
+BPMN_ICON_WIDE_CLASS = "bpmn-icon bpmn-icon-wide"
+
+
 def bpmn_element_svg(icon: rx.Component, name: str, description: str, wide: bool = False) -> rx.Component:
     return rx.hstack(
         rx.el.span(
             icon,
-            class_name="bpmn-icon" + (" bpmn-icon-wide" if wide else ""),
+            class_name=BPMN_ICON_WIDE_CLASS if wide else BPMN_ICON_CLASS,
         ),
         rx.vstack(
             rx.text(name, font_weight="bold", font_size="1.25rem"),
@@ -799,7 +803,7 @@ def bpmn_legend_item(icon: rx.Component, label: str, wide: bool = False) -> rx.C
     return rx.hstack(
         rx.el.span(
             icon,
-            class_name="bpmn-icon" + (" bpmn-icon-wide" if wide else ""),
+            class_name=BPMN_ICON_WIDE_CLASS if wide else BPMN_ICON_CLASS,
         ),
         rx.text(label),
         class_name="bpmn-legend-item",
@@ -807,58 +811,118 @@ def bpmn_legend_item(icon: rx.Component, label: str, wide: bool = False) -> rx.C
     )
 
 
-def beispiel_content() -> rx.Component:
-    import os
-    bpmn_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "beispiel_prozess.bpmn")
-    with open(bpmn_file_path, "r", encoding="utf-8") as f:
-        bpmn_xml = f.read()
-    
-    escaped_bpmn = bpmn_xml.replace('`', '\\`')
-    iframe_html = f'''
-    <!DOCTYPE html>
-    <html>
-        <head>
-            <link rel="stylesheet" href="https://unpkg.com/bpmn-js@18.3.1/dist/assets/bpmn-js.css" />
-            <script src="https://unpkg.com/bpmn-js@18.3.1/dist/bpmn-navigated-viewer.development.js"></script>
-            <style>
-                html, body {{
-                    margin: 0;
-                    padding: 0;
-                    overflow: hidden;
-                    width: 100%;
-                    height: 100%;
-                }}
-                #canvas {{
-                    width: 100%;
-                    height: 100%;
-                    background: white;
-                }}
-                .bjs-container {{
-                    width: 100% !important;
-                    height: 100% !important;
-                }}
-            </style>
-        </head>
-        <body>
-            <div id="canvas"></div>
-            <script>
-                (async function(){{
-                    var viewer = new BpmnJS({{ container: '#canvas' }});
-                    var bpmn = `{escaped_bpmn}`;
-                    try {{
-                        await viewer.importXML(bpmn);
-                        var canvas = viewer.get('canvas');
-                        canvas.zoom('fit-viewport', 'auto');
-                    }} catch (err) {{
-                        console.error('Error loading BPMN:', err);
-                        document.body.innerHTML = '<p style="padding: 1rem; color: red;">Fehler beim Laden des Diagramms</p>';
-                    }}
-                }})();
-            </script>
-        </body>
-    </html>
-    '''
-    
+def bpmn_icon_start_event() -> rx.Component:
+    return rx.el.svg(
+        rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-start"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_end_event() -> rx.Component:
+    return rx.el.svg(
+        rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-end"),
+        rx.el.circle(cx="18", cy="18", r="9.5", class_name="bpmn-end-outer"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_task() -> rx.Component:
+    return rx.el.svg(
+        rx.el.rect(x="4", y="6", width="28", height="20", rx="3", class_name="bpmn-task"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_message() -> rx.Component:
+    return rx.el.svg(
+        rx.el.rect(x="4", y="8", width="28", height="20", rx="2", class_name="bpmn-message"),
+        rx.el.path(d="M4 8l14 10 14-10", class_name="bpmn-message"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_gateway_xor() -> rx.Component:
+    return rx.el.svg(
+        rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
+        rx.el.path(d="M12 12l12 12 M24 12l-12 12", class_name="bpmn-gateway-mark"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_gateway_parallel() -> rx.Component:
+    return rx.el.svg(
+        rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
+        rx.el.path(d="M18 8v20 M8 18h20", class_name="bpmn-gateway-mark"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_sequence_flow() -> rx.Component:
+    return rx.el.svg(
+        rx.el.line(x1="4", y1="18", x2="30", y2="18", class_name="bpmn-flow"),
+        rx.el.polygon(points="30,18 24,14 24,22", class_name="bpmn-flow"),
+        view_box="0 0 36 36",
+    )
+
+
+def bpmn_icon_data_object() -> rx.Component:
+    return rx.el.svg(
+        rx.el.path(d="M8 6h16l4 4v16H8z", class_name="bpmn-data"),
+        rx.el.path(d="M24 6v4h4z", class_name="bpmn-data-fold"),
+        view_box="0 0 36 36",
+    )
+
+
+def build_bpmn_legend() -> rx.Component:
+    return rx.box(
+        bpmn_element_svg(
+            bpmn_icon_start_event(),
+            "Start-Ereignis",
+            "Markiert den Beginn eines Prozesses",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_end_event(),
+            "End-Ereignis",
+            "Markiert das Ende eines Prozesses",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_task(),
+            "Task/Aufgabe",
+            "Eine auszuführende Aktivität",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_message(),
+            "Nachricht",
+            "Kommunikation zwischen Beteiligten",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_gateway_xor(),
+            "Exklusives Gateway",
+            "Entweder/Oder-Entscheidung",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_gateway_parallel(),
+            "Paralleles Gateway",
+            "Parallele Pfade (alle werden ausgeführt)",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_sequence_flow(),
+            "Sequenzfluss",
+            "Verbindet Elemente im Ablauf",
+        ),
+        bpmn_element_svg(
+            bpmn_icon_data_object(),
+            "Datenobjekt",
+            "Daten die im Prozess verwendet werden",
+        ),
+        display="flex",
+        flex_wrap="wrap",
+        gap="1rem",
+        width="100%",
+    )
+
+
+def build_beispiel_content() -> rx.Component:
     return rx.vstack(
         rx.heading("Beispiel: Auftragsannahme im Handwerksbetrieb", size="5", color="#0f766e", class_name="section-title"),
         rx.text(
@@ -867,7 +931,7 @@ def beispiel_content() -> rx.Component:
             font_size="1.1rem",
         ),
         rx.el.iframe(
-            src_doc=iframe_html,
+            src="/beispiel_viewer.html",
             style={
                 "width": "100%",
                 "height": "450px",
@@ -877,89 +941,21 @@ def beispiel_content() -> rx.Component:
             },
         ),
         rx.heading("Welche Symbole gibt es?", size="5", color="#0f766e", margin_top="1.5rem", margin_bottom="1rem", class_name="section-title"),
-        rx.box(
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-start"),
-                    view_box="0 0 36 36",
-                ),
-                "Start-Ereignis",
-                "Markiert den Beginn eines Prozesses",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-end"),
-                    rx.el.circle(cx="18", cy="18", r="9.5", class_name="bpmn-end-outer"),
-                    view_box="0 0 36 36",
-                ),
-                "End-Ereignis",
-                "Markiert das Ende eines Prozesses",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.rect(x="4", y="6", width="28", height="20", rx="3", class_name="bpmn-task"),
-                    view_box="0 0 36 36",
-                ),
-                "Task/Aufgabe",
-                "Eine auszuführende Aktivität",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.rect(x="4", y="8", width="28", height="20", rx="2", class_name="bpmn-message"),
-                    rx.el.path(d="M4 8l14 10 14-10", class_name="bpmn-message"),
-                    view_box="0 0 36 36",
-                ),
-                "Nachricht",
-                "Kommunikation zwischen Beteiligten",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                    rx.el.path(d="M12 12l12 12 M24 12l-12 12", class_name="bpmn-gateway-mark"),
-                    view_box="0 0 36 36",
-                ),
-                "Exklusives Gateway",
-                "Entweder/Oder-Entscheidung",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                    rx.el.path(d="M18 8v20 M8 18h20", class_name="bpmn-gateway-mark"),
-                    view_box="0 0 36 36",
-                ),
-                "Paralleles Gateway",
-                "Parallele Pfade (alle werden ausgeführt)",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.line(x1="4", y1="18", x2="30", y2="18", class_name="bpmn-flow"),
-                    rx.el.polygon(points="30,18 24,14 24,22", class_name="bpmn-flow"),
-                    view_box="0 0 36 36",
-                ),
-                "Sequenzfluss",
-                "Verbindet Elemente im Ablauf",
-            ),
-            bpmn_element_svg(
-                rx.el.svg(
-                    rx.el.path(d="M8 6h16l4 4v16H8z", class_name="bpmn-data"),
-                    rx.el.path(d="M24 6v4h4z", class_name="bpmn-data-fold"),
-                    view_box="0 0 36 36",
-                ),
-                "Datenobjekt",
-                "Daten die im Prozess verwendet werden",
-            ),
-            display="flex",
-            flex_wrap="wrap",
-            gap="1rem",
-            width="100%",
-        ),
+        build_bpmn_legend(),
         align="start",
         width="100%",
         gap="1rem",
     )
 
 
-def funktioniert_content() -> rx.Component:
+BEISPIEL_CONTENT = build_beispiel_content()
+
+
+def beispiel_content() -> rx.Component:
+    return BEISPIEL_CONTENT
+
+
+def build_funktioniert_content() -> rx.Component:
     return rx.vstack(
         rx.heading("So nutzen Sie den BPMN Generator", size="5", color="#0f766e", class_name="section-title"),
         rx.ordered_list(
@@ -1000,8 +996,20 @@ def funktioniert_content() -> rx.Component:
     )
 
 
-def chat_message(msg: Dict[str, Any]) -> rx.Component:
-    is_assistant = msg["role"] == "assistant"
+FUNKTIONIERT_CONTENT = build_funktioniert_content()
+
+
+def funktioniert_content() -> rx.Component:
+    return FUNKTIONIERT_CONTENT
+
+
+def chat_bubble(
+    msg: Dict[str, Any],
+    background: str,
+    border_color: str,
+    margin_left: str,
+    margin_right: str,
+) -> rx.Component:
     return rx.box(
         rx.vstack(
             rx.cond(
@@ -1023,17 +1031,95 @@ def chat_message(msg: Dict[str, Any]) -> rx.Component:
             align="start",
         ),
         padding="1.25rem 1.5rem",
-        background=rx.cond(is_assistant, "rgba(15, 118, 110, 0.08)", "white"),
+        background=background,
         border_radius="20px",
         margin_y="0.35rem",
         border="1px solid",
-        border_color=rx.cond(is_assistant, "rgba(15, 118, 110, 0.2)", "#e2e8f0"),
+        border_color=border_color,
         max_width="85%",
-        margin_left=rx.cond(is_assistant, "0", "auto"),
-        margin_right=rx.cond(is_assistant, "auto", "0"),
+        margin_left=margin_left,
+        margin_right=margin_right,
     )
 
 
+def chat_message(msg: Dict[str, Any]) -> rx.Component:
+    return rx.cond(
+        msg["role"] == "assistant",
+        chat_bubble(msg, "rgba(15, 118, 110, 0.08)", "rgba(15, 118, 110, 0.2)", "0", "auto"),
+        chat_bubble(msg, "white", "#e2e8f0", "auto", "0"),
+    )
+
+
+def minify_js(source: str) -> str:
+    return re.sub(r"\s+", " ", source).strip()
+
+
+JS_START_RECORDING = minify_js("""
+(() => {
+    if (!window.audioRecorder || !window.audioRecorder.start) {
+        return "Audio Recorder nicht geladen";
+    }
+    return window.audioRecorder.start().then((ok) => {
+        if (ok) return "";
+        return window.audioRecorder.getLastError?.() || "Aufnahme fehlgeschlagen";
+    });
+})()
+""")
+
+JS_STOP_RECORDING = minify_js("""
+(() => {
+    try {
+        if (window.audioRecorder && window.audioRecorder.stopSync) {
+            window.audioRecorder.stopSync();
+        }
+        return new Promise((resolve) => {
+            const start = Date.now();
+            const timer = setInterval(() => {
+                const err = window.audioRecorder?.getLastError?.();
+                if (err) {
+                    clearInterval(timer);
+                    resolve(JSON.stringify({ error: String(err) }));
+                    return;
+                }
+                const data = window.audioRecorder?.getLastRecording?.();
+                if (data) {
+                    clearInterval(timer);
+                    resolve(data);
+                    return;
+                }
+                if (Date.now() - start > 15000) {
+                    clearInterval(timer);
+                    resolve(JSON.stringify({ error: "Timeout beim Lesen der Audiodaten" }));
+                }
+            }, 200);
+        });
+    } catch (err) {
+        return JSON.stringify({ error: String(err) });
+    }
+})()
+""")
+
+JS_DOWNLOAD_XML = minify_js("""
+(() => {
+    const xmlEl = document.getElementById("bpmn-xml");
+    if (!xmlEl) return;
+    const xml = xmlEl.textContent || "";
+    const blob = new Blob([xml], { type: "application/xml" });
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement("a");
+    a.href = url;
+    a.download = "prozessmodell.bpmn";
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+    URL.revokeObjectURL(url);
+})();
+""")
+
+
+PROCESS_OPTIONS = ["Angebots- und Auftragserstellung", "Personalmanagement", "Materialplanung"]
+
+
 def interview_section() -> rx.Component:
     return rx.box(
         rx.vstack(
@@ -1052,7 +1138,7 @@ def interview_section() -> rx.Component:
                         size="5",
                     ),
                     rx.select(
-                        ["Angebots- und Auftragserstellung", "Personalmanagement", "Materialplanung"],
+                        PROCESS_OPTIONS,
                         placeholder="Prozesstyp auswählen...",
                         value=BPMNState.process_type,
                         on_change=BPMNState.set_process_type,
@@ -1133,17 +1219,7 @@ def interview_section() -> rx.Component:
                                 on_click=[
                                     BPMNState.start_recording,
                                     rx.call_script(
-                                        """
-                                        (() => {
-                                            if (!window.audioRecorder || !window.audioRecorder.start) {
-                                                return "Audio Recorder nicht geladen";
-                                            }
-                                            return window.audioRecorder.start().then((ok) => {
-                                                if (ok) return "";
-                                                return window.audioRecorder.getLastError?.() || "Aufnahme fehlgeschlagen";
-                                            });
-                                        })()
-                                        """,
+                                        JS_START_RECORDING,
                                         callback=BPMNState.handle_recording_error,
                                     )
                                 ],
@@ -1183,38 +1259,7 @@ def interview_section() -> rx.Component:
                                     on_click=[
                                         BPMNState.prepare_stop,
                                         rx.call_script(
-                                            """
-                                            (() => {
-                                                try {
-                                                    if (window.audioRecorder && window.audioRecorder.stopSync) {
-                                                        window.audioRecorder.stopSync();
-                                                    }
-                                                    return new Promise((resolve) => {
-                                                        const start = Date.now();
-                                                        const timer = setInterval(() => {
-                                                            const err = window.audioRecorder?.getLastError?.();
-                                                            if (err) {
-                                                                clearInterval(timer);
-                                                                resolve(JSON.stringify({ error: String(err) }));
-                                                                return;
-                                                            }
-                                                            const data = window.audioRecorder?.getLastRecording?.();
-                                                            if (data) {
-                                                                clearInterval(timer);
-                                                                resolve(data);
-                                                                return;
-                                                            }
-                                                            if (Date.now() - start > 15000) {
-                                                                clearInterval(timer);
-                                                                resolve(JSON.stringify({ error: "Timeout beim Lesen der Audiodaten" }));
-                                                            }
-                                                        }, 200);
-                                                    });
-                                                } catch (err) {
-                                                    return JSON.stringify({ error: String(err) });
-                                                }
-                                            })()
-                                            """,
+                                            JS_STOP_RECORDING,
                                             callback=BPMNState.stop_recording_and_transcribe,
                                         ),
                                     ],
@@ -1430,82 +1475,7 @@ def output_section() -> rx.Component:
                 width="100%",
             ),
             rx.heading("Legende", size="5", color="#0f766e", margin_top="1.5rem", margin_bottom="1rem", class_name="section-title"),
-            rx.box(
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-start"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Start-Ereignis",
-                    "Markiert den Beginn eines Prozesses",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.circle(cx="18", cy="18", r="12", class_name="bpmn-end"),
-                        rx.el.circle(cx="18", cy="18", r="9.5", class_name="bpmn-end-outer"),
-                        view_box="0 0 36 36",
-                    ),
-                    "End-Ereignis",
-                    "Markiert das Ende eines Prozesses",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.rect(x="4", y="6", width="28", height="20", rx="3", class_name="bpmn-task"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Task/Aufgabe",
-                    "Eine auszuführende Aktivität",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.rect(x="4", y="8", width="28", height="20", rx="2", class_name="bpmn-message"),
-                        rx.el.path(d="M4 8l14 10 14-10", class_name="bpmn-message"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Nachricht",
-                    "Kommunikation zwischen Beteiligten",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                        rx.el.path(d="M12 12l12 12 M24 12l-12 12", class_name="bpmn-gateway-mark"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Exklusives Gateway",
-                    "Entweder/Oder-Entscheidung",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.polygon(points="18,3 33,18 18,33 3,18", class_name="bpmn-gateway"),
-                        rx.el.path(d="M18 8v20 M8 18h20", class_name="bpmn-gateway-mark"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Paralleles Gateway",
-                    "Parallele Pfade (alle werden ausgeführt)",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.line(x1="4", y1="18", x2="30", y2="18", class_name="bpmn-flow"),
-                        rx.el.polygon(points="30,18 24,14 24,22", class_name="bpmn-flow"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Sequenzfluss",
-                    "Verbindet Elemente im Ablauf",
-                ),
-                bpmn_element_svg(
-                    rx.el.svg(
-                        rx.el.path(d="M8 6h16l4 4v16H8z", class_name="bpmn-data"),
-                        rx.el.path(d="M24 6v4h4z", class_name="bpmn-data-fold"),
-                        view_box="0 0 36 36",
-                    ),
-                    "Datenobjekt",
-                    "Daten die im Prozess verwendet werden",
-                ),
-                display="flex",
-                flex_wrap="wrap",
-                gap="1rem",
-                width="100%",
-            ),
+            build_bpmn_legend(),
             rx.hstack(
                 rx.button(
                     rx.icon("download", size=16),
@@ -1513,22 +1483,7 @@ def output_section() -> rx.Component:
                     color_scheme="teal",
                     variant="solid",
                     on_click=rx.call_script(
-                        """
-                        (() => {
-                            const xmlEl = document.getElementById("bpmn-xml");
-                            if (!xmlEl) return;
-                            const xml = xmlEl.textContent || "";
-                            const blob = new Blob([xml], { type: "application/xml" });
-                            const url = URL.createObjectURL(blob);
-                            const a = document.createElement("a");
-                            a.href = url;
-                            a.download = "prozessmodell.bpmn";
-                            document.body.appendChild(a);
-                            a.click();
-                            a.remove();
-                            URL.revokeObjectURL(url);
-                        })();
-                        """
+                        JS_DOWNLOAD_XML
                     ),
                 ),
                 rx.button(
@@ -1719,4 +1674,5 @@ app = rx.App(
     ),
 )
 
+app.register_lifespan_task(async_pool_lifespan)
 app.add_page(index, route="/", title="BPMN Generator - Für das Handwerk")
@@ -1,12 +1,30 @@
 import re
+import sys
 import json
+import asyncio
+import hashlib
 import logging
-import xml.etree.ElementTree as ET
+import threading
+from collections import OrderedDict
 from openai import OpenAI
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List, Union
+from openai.types.shared_params import ResponseFormatJSONSchema
 
 from .prompt_loader import load_prompt, format_prompt, Prompts
 
+try:
+    from lxml import etree as ET  # type: ignore[import]
+except ImportError:
+    import xml.etree.ElementTree as ET  # type: ignore[no-redef]
+
+# orjson.JSONDecodeError erbt von json.JSONDecodeError, die except-Zweige gelten für beide
+_json_loads: Callable[[Union[str, bytes]], Any]
+try:
+    import orjson  # type: ignore[import]
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
@@ -18,36 +36,135 @@ if not logger.handlers:
     logger.addHandler(console_handler)
 
 
+BPMN_DEFINITIONS_OPEN = "<bpmn:definitions"
+BPMN_DEFINITIONS_CLOSE = "</bpmn:definitions>"
+BPMN_DIAGRAM_OPEN = "<bpmndi:BPMNDiagram"
+BPMN_DIAGRAM_CLOSE = "</bpmndi:BPMNDiagram>"
+XML_PATTERN = re.compile(r"<\?xml.*?>.*</.*?>", re.DOTALL)
+
+BPMN_NS = "http://www.omg.org/spec/BPMN/20100524/MODEL"
+BPMNDI_NS = "http://www.omg.org/spec/BPMN/20100524/DI"
+DC_NS = "http://www.omg.org/spec/DD/20100524/DC"
+DI_NS = "http://www.omg.org/spec/DD/20100524/DI"
+
+# Präfixe, die ein eingefügtes BPMNDiagram im Wurzelelement gebunden braucht
+DI_NAMESPACE_DECLARATIONS = tuple(
+    re.compile(r"\sxmlns:" + prefix + r"\s*=\s*([\"'])" + re.escape(namespace) + r"\1")
+    for prefix, namespace in (("bpmndi", BPMNDI_NS), ("dc", DC_NS), ("di", DI_NS))
+)
+
+
+def qualified_tag(local_name: str, namespace: str = BPMN_NS) -> str:
+    # Interniert, damit Vergleiche mit den vom Parser gelieferten Tags möglichst
+    # schon an der Objektidentität entschieden werden
+    return sys.intern(f"{{{namespace}}}{local_name}")
+
+
+BPMN_NODE_TAGS = frozenset(
+    qualified_tag(tag) for tag in (
+        'task', 'subProcess', 'startEvent', 'endEvent',
+        'intermediateThrowEvent', 'intermediateCatchEvent',
+        'exclusiveGateway', 'parallelGateway', 'inclusiveGateway',
+        'gateway', 'boundaryEvent', 'dataObjectReference', 'dataStoreReference'
+    )
+)
+BPMN_FLOW_TAGS = frozenset(
+    qualified_tag(tag) for tag in (
+        'sequenceFlow', 'messageFlow',
+        'dataOutputAssociation', 'dataInputAssociation'
+    )
+)
+BPMN_DI_SHAPE_TAG = qualified_tag("BPMNShape", BPMNDI_NS)
+BPMN_DI_EDGE_TAG = qualified_tag("BPMNEdge", BPMNDI_NS)
+BPMN_DEFINITIONS_TAG = qualified_tag("definitions")
+BPMN_DI_DIAGRAM_TAG = qualified_tag("BPMNDiagram", BPMNDI_NS)
+
+
+def parse_xml(xml_text: str):
+    # lxml lehnt str-Eingaben mit Encoding-Deklaration ab, daher immer als Bytes parsen
+    return ET.fromstring(xml_text.encode("utf-8"))
+
+
+def log_prompt_usage(agent_name: str, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    logger.info("%s Prompt Tokens: %s (cached: %s)", agent_name, usage.prompt_tokens, cached_tokens)
+
+
 def extract_xml_content(response: str) -> str:
-    xml_pattern = r"<\?xml.*?>.*</.*?>"
-    match = re.search(xml_pattern, response, re.DOTALL)
-    if match:
-        return match.group(0)
-    bpmn_pattern = r"<bpmn:definitions[\s\S]*</bpmn:definitions>"
-    match = re.search(bpmn_pattern, response, re.DOTALL)
-    if match:
-        return match.group(0)
+    start = response.find("<?xml")
+    if start != -1:
+        close_tag = response.rfind("</")
+        end = response.find(">", close_tag) if close_tag > start else -1
+        if end != -1:
+            return response[start:end + 1]
+        # Ungewöhnliche Struktur: auf den Regex ausweichen
+        match = XML_PATTERN.search(response)
+        if match:
+            return match.group(0)
+    start = response.find(BPMN_DEFINITIONS_OPEN)
+    end = response.rfind(BPMN_DEFINITIONS_CLOSE)
+    if start != -1 and end > start:
+        return response[start:end + len(BPMN_DEFINITIONS_CLOSE)]
     return response.strip()
 
 
 def extract_xml_diagram_content(response: str) -> str:
-    xml_diagram_pattern = r"(<bpmndi:BPMNDiagram[\s\S]*?</bpmndi:BPMNDiagram>)"
-    match = re.search(xml_diagram_pattern, response, re.DOTALL)
-    if match:
-        return match.group(1)
-    return ""
+    start = response.find(BPMN_DIAGRAM_OPEN)
+    if start == -1:
+        return ""
+    end = response.find(BPMN_DIAGRAM_CLOSE, start)
+    if end == -1:
+        return ""
+    return response[start:end + len(BPMN_DIAGRAM_CLOSE)]
 
 
 def extract_json_content(response: str) -> Dict[str, Any]:
-    json_pattern = r"\{.*\}"
-    match = re.search(json_pattern, response, re.DOTALL)
-    if match:
-        json_text = match.group(0)
-        return json.loads(json_text)
+    start = response.find("{")
+    end = response.rfind("}")
+    if 0 <= start < end:
+        return _json_loads(response[start:end + 1])
     return {}
 
 
+def extract_balanced_json(text: str) -> Optional[str]:
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return None
+
+
 def parse_json_payload(text: str) -> Dict[str, Any]:
+    try:
+        payload = _json_loads(text)
+    except (json.JSONDecodeError, TypeError):
+        payload = None
+    if isinstance(payload, dict):
+        return payload
+
     cleaned = text.strip()
     
     if cleaned.startswith('"') and cleaned.endswith('"'):
@@ -66,56 +183,141 @@ def parse_json_payload(text: str) -> Dict[str, Any]:
     cleaned = cleaned.strip()
     
     try:
-        return json.loads(cleaned)
+        return _json_loads(cleaned)
     except json.JSONDecodeError:
-        match = re.search(r"\{[^{}]*\}", cleaned, re.DOTALL)
-        if match:
+        balanced = extract_balanced_json(cleaned)
+        if balanced:
             try:
-                return json.loads(match.group(0))
+                return _json_loads(balanced)
             except json.JSONDecodeError:
                 pass
-        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        if match:
+        start = cleaned.find("{")
+        end = cleaned.rfind("}")
+        if 0 <= start < end:
             try:
-                return json.loads(match.group(0))
+                return _json_loads(cleaned[start:end + 1])
             except json.JSONDecodeError:
                 pass
-        if "flagged" in cleaned.lower():
-            is_flagged = "true" in cleaned.lower() or cleaned.lower().strip() == "flagged"
+        lowered = cleaned.lower()
+        if "flagged" in lowered:
+            is_flagged = "true" in lowered or lowered == "flagged"
             return {"flagged": is_flagged, "reason": "", "nudge": "Bitte beantworten Sie die Frage zum Geschäftsprozess." if is_flagged else ""}
-        if "followup" in cleaned.lower():
+        if "followup" in lowered:
             return {"ask_followup": False, "question": ""}
         
         return {}
 
 class BPMNGenerator:
     NAMESPACE = {
-        'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-        'bpmndi': 'http://www.omg.org/spec/BPMN/20100524/DI',
+        'bpmn': BPMN_NS,
+        'bpmndi': BPMNDI_NS,
         'dc': 'http://www.omg.org/spec/DD/20100524/DC',
         'di': 'http://www.omg.org/spec/DD/20100524/DI',
         'bioc': 'http://bpmn.io/schema/bpmn/biocolor/1.0'
     }
 
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
+    REVIEW_RESPONSE_FORMAT: ResponseFormatJSONSchema = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "bpmn_review",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "xml": {"type": "string"},
+                },
+                "required": ["xml"],
+                "additionalProperties": False,
+            },
+        },
+    }
 
-    def text_to_model(self, process_description: str) -> str:
-        cot_prompt = load_prompt(Prompts.COT)
-        prompt = cot_prompt + "\n\nTextual Process Description: " + process_description
-        
-        response = self.client.chat.completions.create(
+    INITIAL_MARKER = "<<INITIAL>>"
+    IMPROVED_MARKER = "<<IMPROVED>>"
+    CHAINED_OUTPUT_INSTRUCTIONS = (
+        "\n\nWork in two stages on the textual process description given by the user. "
+        "First follow the modeling task above and write the initial BPMN 2.0 XML after the line "
+        "<<INITIAL>>. Then treat that XML as the baseline for the review task and write the final "
+        "improved BPMN 2.0 XML after the line <<IMPROVED>>. Output nothing besides the two markers "
+        "and the two XML documents."
+    )
+
+    def __init__(self, client: OpenAI):
+        self.client = client
+        self._parse_cache: Optional[tuple] = None
+
+    def _parsed(self, bpmn_xml: str):
+        # Vollständigkeitsprüfung, Merge und Mermaid-Export arbeiten meist auf
+        # demselben Dokument, daher wird der letzte Elementbaum wiederverwendet.
+        cached = self.cached_tree(bpmn_xml)
+        if cached is None:
+            cached = parse_xml(bpmn_xml)
+            self._parse_cache = (bpmn_xml, cached)
+        return cached
+
+    def cached_tree(self, bpmn_xml: str):
+        if self._parse_cache is not None and self._parse_cache[0] == bpmn_xml:
+            return self._parse_cache[1]
+        return None
+
+    def _stream_completion(
+        self, messages: list, close_tag: str, temperature: float, after: Optional[str] = None
+    ) -> str:
+        # Antwort streamen und abbrechen, sobald das schließende Tag (ggf. nach
+        # dem Marker ``after``) vollständig angekommen ist.
+        content = ""
+        search_from = 0 if after is None else -1
+        with self.client.chat.completions.create(
             model="gpt-5.2",
-            messages=[
-                {"role": "user", "content": prompt}
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        ) as stream:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                scan_start = max(len(content) - len(close_tag), 0)
+                content += delta
+                if after is not None and search_from == -1:
+                    marker = content.find(after, max(scan_start - len(after), 0))
+                    if marker == -1:
+                        continue
+                    search_from = marker + len(after)
+                    scan_start = search_from
+                end = content.find(close_tag, max(scan_start, search_from))
+                if end != -1:
+                    return content[:end + len(close_tag)]
+        return content
+
+    def text_to_model(self, process_description: str) -> str:
+        # Erstmodell und Verbesserung in einem Aufruf: der statische Prompt-Teil
+        # steht als System-Nachricht vorn, damit der Provider-Prefix-Cache greift.
+        system_prompt = (
+            load_prompt(Prompts.COT) +
+            "\n\n---\n\n" +
+            load_prompt(Prompts.IMPROVEMENT) +
+            self.CHAINED_OUTPUT_INSTRUCTIONS
+        )
+
+        content = self._stream_completion(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": "Textual Process Description: " + process_description}
             ],
+            BPMN_DEFINITIONS_CLOSE,
             temperature=0.7,
+            after=self.IMPROVED_MARKER,
         )
-        
-        initial_xml = extract_xml_content(response.choices[0].message.content)
-        improved_xml = self.improve_model(initial_xml, process_description)
-        return improved_xml
+
+        initial_part, _, improved_part = content.partition(self.IMPROVED_MARKER)
+        initial_xml = extract_xml_content(initial_part.replace(self.INITIAL_MARKER, ""))
+        if not improved_part.strip():
+            # Modell hat die Marker ignoriert: separaten Verbesserungslauf nachholen
+            return self.improve_model(initial_xml, process_description)
+        return extract_xml_content(improved_part)
 
     def improve_model(self, bpmn_xml: str, process_description: str) -> str:
         improvement_prompt = load_prompt(Prompts.IMPROVEMENT)
@@ -125,48 +327,60 @@ class BPMNGenerator:
             "\n\nTextual Process Description: " + process_description
         )
         
+        content = self._stream_completion(
+            [{"role": "user", "content": prompt}],
+            BPMN_DEFINITIONS_CLOSE,
+            temperature=0.5,
+        )
+        
+        xml_content = extract_xml_content(content)
+        return xml_content
+
+    def check_and_improve(self, bpmn_xml: str, process_description: str, known_issues: Optional[list] = None) -> Dict[str, Any]:
+        improvement_prompt = load_prompt(Prompts.IMPROVEMENT)
+        prompt = (
+            improvement_prompt +
+            "\n\nResponse format: Return a JSON object with 'xml' (the complete improved BPMN 2.0 XML)." +
+            "\n\nBPMN XML: " + bpmn_xml +
+            "\n\nTextual Process Description: " + process_description
+        )
+        if known_issues:
+            prompt += "\n\nKnown Issues: " + "; ".join(known_issues)
+
         response = self.client.chat.completions.create(
             model="gpt-5.2",
             messages=[
                 {"role": "user", "content": prompt}
             ],
             temperature=0.5,
+            response_format=self.REVIEW_RESPONSE_FORMAT,
         )
-        
-        xml_content = extract_xml_content(response.choices[0].message.content)
-        return xml_content
 
-    def check_xml_completeness(self, bpmn_xml: str) -> list:
-        issues = []
+        result = parse_json_payload(response.choices[0].message.content or "")
+        xml_content = extract_xml_content(result.get("xml", "")) or bpmn_xml
+        return {"xml": xml_content}
+
+    def check_xml_completeness(self, bpmn_xml: str) -> List[str]:
+        issues: List[str] = []
         try:
-            root = ET.fromstring(bpmn_xml)
+            root = self._parsed(bpmn_xml)
         except ET.ParseError as e:
             return [f"XML Parse Error: {e}"]
 
-        node_tags = [
-            'task', 'subProcess', 'startEvent', 'endEvent',
-            'intermediateThrowEvent', 'intermediateCatchEvent',
-            'exclusiveGateway', 'parallelGateway', 'inclusiveGateway',
-            'gateway', 'boundaryEvent', 'dataObjectReference', 'dataStoreReference'
-        ]
-
-        flow_tags = [
-            'sequenceFlow', 'messageFlow', 
-            'dataOutputAssociation', 'dataInputAssociation'
-        ]
-
-        node_count = sum(
-            len(root.findall(f".//bpmn:{tag}", self.NAMESPACE))
-            for tag in node_tags
-        )
-
-        flow_count = sum(
-            len(root.findall(f".//bpmn:{tag}", self.NAMESPACE))
-            for tag in flow_tags
-        )
-        
-        di_shape_count = len(root.findall(".//bpmndi:BPMNShape", self.NAMESPACE))
-        di_edge_count = len(root.findall(".//bpmndi:BPMNEdge", self.NAMESPACE))
+        node_count: int = 0
+        flow_count: int = 0
+        di_shape_count: int = 0
+        di_edge_count: int = 0
+        for el in root.iter():
+            tag: Any = el.tag
+            if tag in BPMN_NODE_TAGS:
+                node_count += 1
+            elif tag in BPMN_FLOW_TAGS:
+                flow_count += 1
+            elif tag == BPMN_DI_SHAPE_TAG:
+                di_shape_count += 1
+            elif tag == BPMN_DI_EDGE_TAG:
+                di_edge_count += 1
 
         if node_count > di_shape_count:
             issues.append(f"Missing DI shapes: {node_count - di_shape_count}")
@@ -184,54 +398,198 @@ class BPMNGenerator:
         if process_description:
             prompt += "\n\nTextual Process Description: " + process_description
 
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+        content = self._stream_completion(
+            [{"role": "user", "content": prompt}],
+            BPMN_DIAGRAM_CLOSE,
             temperature=0.5,
         )
 
-        di_part = extract_xml_diagram_content(response.choices[0].message.content)
+        di_part = extract_xml_diagram_content(content)
         return di_part
 
+    @staticmethod
+    def _wrap_diagram(diagram: str) -> str:
+        return f'''<temp
+            xmlns="{BPMN_NS}"
+            xmlns:bpmndi="{BPMNDI_NS}"
+            xmlns:dc="{DC_NS}"
+            xmlns:di="{DI_NS}">
+            {diagram}
+        </temp>'''
+
+    @staticmethod
+    def _declares_di_namespaces(bpmn_xml: str) -> bool:
+        start = bpmn_xml.find(BPMN_DEFINITIONS_OPEN)
+        if start == -1:
+            return False
+        end = bpmn_xml.find(">", start)
+        if end == -1:
+            return False
+        start_tag = bpmn_xml[start:end]
+        return all(pattern.search(start_tag) for pattern in DI_NAMESPACE_DECLARATIONS)
+
     def merge_bpmn_xml_diagram(self, bpmn_xml: str, diagram: str) -> str:
+        if BPMN_DIAGRAM_OPEN not in diagram:
+            return bpmn_xml
+        # Einfügen als Text nur, wenn die Wurzel alle DI-Präfixe bindet und das Diagramm selbst gültig ist
+        if not self._declares_di_namespaces(bpmn_xml):
+            return self._merge_bpmn_xml_diagram_tree(bpmn_xml, diagram)
+        try:
+            parse_xml(self._wrap_diagram(diagram))
+        except ET.ParseError:
+            return self._merge_bpmn_xml_diagram_tree(bpmn_xml, diagram)
+        definitions_end = bpmn_xml.rfind(BPMN_DEFINITIONS_CLOSE)
+        if definitions_end != -1:
+            head = bpmn_xml[:definitions_end]
+            diagram_start = head.find(BPMN_DIAGRAM_OPEN)
+            if diagram_start != -1:
+                diagram_end = head.rfind(BPMN_DIAGRAM_CLOSE)
+                if diagram_end < diagram_start:
+                    return self._merge_bpmn_xml_diagram_tree(bpmn_xml, diagram)
+                head = head[:diagram_start] + head[diagram_end + len(BPMN_DIAGRAM_CLOSE):]
+            return head.rstrip() + "\n  " + diagram.strip() + "\n" + bpmn_xml[definitions_end:]
+        return self._merge_bpmn_xml_diagram_tree(bpmn_xml, diagram)
+
+    def _merge_bpmn_xml_diagram_tree(self, bpmn_xml: str, diagram: str) -> str:
+        # Fallback für abweichende Präfixe: über den Elementbaum zusammenführen
         try:
-            root = ET.fromstring(bpmn_xml)
+            root = self._parsed(bpmn_xml)
         except ET.ParseError:
             return bpmn_xml
             
-        definitions_tag = f"{{{self.NAMESPACE['bpmn']}}}definitions"
-        definitions_el = root if root.tag == definitions_tag else root.find('.//bpmn:definitions', self.NAMESPACE)
+        definitions_el = root if root.tag == BPMN_DEFINITIONS_TAG else next(root.iter(BPMN_DEFINITIONS_TAG), None)
         
         if definitions_el is None:
             return bpmn_xml
-        for diagram_el in definitions_el.findall('./bpmndi:BPMNDiagram', self.NAMESPACE):
+        for diagram_el in definitions_el.findall(BPMN_DI_DIAGRAM_TAG):
             definitions_el.remove(diagram_el)
-        wrapped_diagram = f'''<temp
-            xmlns="http://www.omg.org/spec/BPMN/20100524/MODEL"
-            xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI"
-            xmlns:dc="http://www.omg.org/spec/DD/20100524/DC"
-            xmlns:di="http://www.omg.org/spec/DD/20100524/DI">
-            {diagram}
-        </temp>'''
         try:
-            wrapped_root = ET.fromstring(wrapped_diagram)
-            diagram_element = wrapped_root.find('.//bpmndi:BPMNDiagram', self.NAMESPACE)
+            wrapped_root = parse_xml(self._wrap_diagram(diagram))
+            diagram_element = next(wrapped_root.iter(BPMN_DI_DIAGRAM_TAG), None)
             
             if diagram_element is not None:
                 definitions_el.append(diagram_element)
-                return ET.tostring(definitions_el, encoding="unicode")
+                merged_xml = ET.tostring(definitions_el, encoding="unicode")
+                # Der Baum wurde verändert und entspricht jetzt dem zusammengeführten XML
+                self._parse_cache = (merged_xml, definitions_el)
+                return merged_xml
         except ET.ParseError:
             pass
-            
+        # Bestehende Diagramme wurden bereits aus dem zwischengespeicherten Baum entfernt
+        self._parse_cache = None
         return bpmn_xml
 
 
 class InterviewAgents:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.client = OpenAI(api_key=api_key)
+    # Low-temperature agents answer identical prompts identically, so their
+    # replies are reused across calls and sessions. The key covers the full
+    # prompt, so entries never go stale; the LRU bound limits memory.
+    RESPONSE_CACHE_SIZE = 256
+    CACHEABLE_TEMPERATURE = 0.3
+    _response_cache: "OrderedDict[str, str]" = OrderedDict()
+    _response_cache_lock = threading.Lock()
+
+    # Feste Request-Parameter je Agent; pro Aufruf kommt nur die Nachricht hinzu
+    REQUEST_TEMPLATES: Dict[str, Dict[str, Any]] = {
+        "Security Agent": {"model": "gpt-5.2", "temperature": 0.1, "max_completion_tokens": 250},
+        "Summary Agent": {"model": "gpt-5.2", "temperature": 0.2, "max_completion_tokens": 1500},
+        "Probing Agent": {"model": "gpt-5.2", "temperature": 0.3, "max_completion_tokens": 200},
+        "Topic Manager": {"model": "gpt-5.2", "temperature": 0.2, "max_completion_tokens": 250},
+        "Summarize Answer": {"model": "gpt-5.2", "temperature": 0.2, "max_completion_tokens": 200},
+    }
+
+    def __init__(self, client: OpenAI):
+        self.client = client
+
+    def _complete(self, agent_name: str, prompt: str, discard: Optional[threading.Event] = None) -> str:
+        template = self.REQUEST_TEMPLATES[agent_name]
+        cache_key = None
+        if template["temperature"] <= self.CACHEABLE_TEMPERATURE:
+            # Die Parameter sind je Agent fest, Agentenname und Prompt identifizieren den Request
+            cache_key = hashlib.blake2b(
+                f"{agent_name}\0{prompt}".encode(),
+                digest_size=16,
+            ).hexdigest()
+            with self._response_cache_lock:
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    self._response_cache.move_to_end(cache_key)
+            if cached is not None:
+                logger.info("%s served from response cache", agent_name)
+                return cached
+
+        response = self.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            **template,
+        )
+
+        log_prompt_usage(agent_name, response)
+        content = response.choices[0].message.content.strip()
+
+        # Verworfene Antworten (z.B. zu einer markierten Eingabe) nicht zwischenspeichern
+        if cache_key is not None and not (discard is not None and discard.is_set()):
+            with self._response_cache_lock:
+                self._response_cache[cache_key] = content
+                if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                    self._response_cache.popitem(last=False)
+        return content
+
+    @staticmethod
+    def _discard_summaries(summaries_task: "asyncio.Future", discard: threading.Event) -> None:
+        discard.set()
+        summaries_task.cancel()
+        # Ergebnis abholen, damit asyncio den Abbruch nicht als unbehandelt meldet
+        summaries_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def run_parallel_agents(
+        self,
+        question_text: str,
+        answer_text: str,
+        process_context: str,
+        summary_text: str,
+        topic_summary_input: str,
+        latest_turn: str,
+        topic_turns: list,
+    ) -> Dict[str, Any]:
+        # Sicherheitsprüfung und beide Zusammenfassungen hängen nur von Frage und
+        # Antwort ab; sie laufen parallel, die Zusammenfassungen werden bei einer
+        # markierten Antwort verworfen. Das Abbrechen stoppt die Threads nicht,
+        # daher verhindert ``discard``, dass ihre Antworten im Cache landen.
+        discard = threading.Event()
+        security_task = asyncio.ensure_future(asyncio.to_thread(
+            self.run_security_agent,
+            question_text,
+            answer_text,
+            process_context,
+            summary_text,
+        ))
+        summaries_task = asyncio.gather(
+            asyncio.to_thread(self.summarize_answer, question_text, topic_summary_input, discard),
+            asyncio.to_thread(
+                self.run_summary_agent,
+                summary_text,
+                question_text,
+                latest_turn,
+                topic_turns,
+                process_context,
+                discard,
+            ),
+        )
+        try:
+            security_result = await security_task
+        except BaseException:
+            self._discard_summaries(summaries_task, discard)
+            raise
+        if security_result.get("flagged"):
+            self._discard_summaries(summaries_task, discard)
+            return {"security": security_result}
+
+        answer_summary, new_summary = await summaries_task
+        return {
+            "security": security_result,
+            "answer_summary": answer_summary,
+            "new_summary": new_summary,
+        }
 
     def run_security_agent(
         self, 
@@ -249,20 +607,13 @@ class InterviewAgents:
             question_text=question_text,
             answer_text=answer_text
         )
-        logger.debug(f"Prompt: {prompt}")
-        
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_completion_tokens=250,
-        )
+        logger.debug("Prompt: %s", prompt)
         
-        raw_response = response.choices[0].message.content.strip()
-        logger.info(f"Security Agent RAW Response: {raw_response}")
+        raw_response = self._complete("Security Agent", prompt)
+        logger.info("Security Agent RAW Response: %s", raw_response)
         
         result = parse_json_payload(raw_response)
-        logger.info(f"Security Agent Parsed Result: {result}")
+        logger.info("Security Agent Parsed Result: %s", result)
         logger.info("=== SECURITY AGENT END ===")
         
         return result
@@ -273,11 +624,12 @@ class InterviewAgents:
         question_text: str,
         answer_text: str,
         topic_history: list,
-        process_context: str
+        process_context: str,
+        discard: Optional[threading.Event] = None
     ) -> str:
         logger.info("=== SUMMARY AGENT START ===")
-        logger.debug(f"Question: {question_text}")
-        logger.debug(f"Previous Summary Length: {len(summary_text)} chars")
+        logger.debug("Question: %s", question_text)
+        logger.debug("Previous Summary Length: %d chars", len(summary_text))
         
         prompt = format_prompt(
             Prompts.SUMMARY_AGENT,
@@ -288,15 +640,8 @@ class InterviewAgents:
             topic_history=topic_history
         )
         
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_completion_tokens=1500,
-        )
-        
-        result = response.choices[0].message.content.strip()
-        logger.info(f"Summary Agent Response: {result[:300]}..." if len(result) > 300 else f"Summary Agent Response: {result}")
+        result = self._complete("Summary Agent", prompt, discard)
+        logger.info("Summary Agent Response: %.300s%s", result, "..." if len(result) > 300 else "")
         logger.info("=== SUMMARY AGENT END ===")
         
         return result
@@ -310,8 +655,8 @@ class InterviewAgents:
         process_context: str
     ) -> Dict[str, Any]:
         logger.info("=== PROBING AGENT START ===")
-        logger.debug(f"Question: {question_text}")
-        logger.debug(f"Answer: {answer_text[:200]}..." if len(answer_text) > 200 else f"Answer: {answer_text}")
+        logger.debug("Question: %s", question_text)
+        logger.debug("Answer: %.200s%s", answer_text, "..." if len(answer_text) > 200 else "")
         
         prompt = format_prompt(
             Prompts.PROBING_AGENT,
@@ -322,18 +667,11 @@ class InterviewAgents:
             answer_text=answer_text
         )
         
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_completion_tokens=200,
-        )
-        
-        raw_response = response.choices[0].message.content.strip()
-        logger.info(f"Probing Agent RAW Response: {raw_response}")
+        raw_response = self._complete("Probing Agent", prompt)
+        logger.info("Probing Agent RAW Response: %s", raw_response)
         
         result = parse_json_payload(raw_response)
-        logger.info(f"Probing Agent Parsed Result: {result}")
+        logger.info("Probing Agent Parsed Result: %s", result)
         logger.info("=== PROBING AGENT END ===")
         
         return result
@@ -364,18 +702,11 @@ class InterviewAgents:
             topic_history=topic_history,
         )
 
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_completion_tokens=250,
-        )
-
-        raw_response = response.choices[0].message.content.strip()
-        logger.info(f"Topic Manager RAW Response: {raw_response}")
+        raw_response = self._complete("Topic Manager", prompt)
+        logger.info("Topic Manager RAW Response: %s", raw_response)
 
         result = parse_json_payload(raw_response)
-        logger.info(f"Topic Manager Parsed Result: {result}")
+        logger.info("Topic Manager Parsed Result: %s", result)
         logger.info("=== TOPIC MANAGER END ===")
 
         remaining = [t for t in topic_defs if t.get("key") not in topics_completed]
@@ -403,9 +734,11 @@ class InterviewAgents:
             "next_question": next_question,
         }
 
-    def summarize_answer(self, question_text: str, answer_text: str) -> str:
+    def summarize_answer(
+        self, question_text: str, answer_text: str, discard: Optional[threading.Event] = None
+    ) -> str:
         logger.info("=== SUMMARIZE ANSWER START ===")
-        logger.debug(f"Question: {question_text}")
+        logger.debug("Question: %s", question_text)
         
         if not answer_text:
             logger.info("No answer text, returning empty")
@@ -417,71 +750,8 @@ class InterviewAgents:
             answer_text=answer_text
         )
         
-        response = self.client.chat.completions.create(
-            model="gpt-5.2",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_completion_tokens=200,
-        )
-        
-        result = response.choices[0].message.content.strip() or answer_text
-        logger.info(f"Summarize Answer Response: {result}")
+        result = self._complete("Summarize Answer", prompt, discard) or answer_text
+        logger.info("Summarize Answer Response: %s", result)
         logger.info("=== SUMMARIZE ANSWER END ===")
         
         return result
-
-
-def bpmn_to_mermaid(bpmn_xml: str) -> str:
-    try:
-        root = ET.fromstring(bpmn_xml)
-    except ET.ParseError:
-        return "graph TD\n    Error[Fehler beim Parsen]"
-    
-    ns = {'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL'}
-    
-    mermaid_lines = ["graph TD"]
-    start_events = root.findall(".//bpmn:startEvent", ns)
-    end_events = root.findall(".//bpmn:endEvent", ns)
-    tasks = root.findall(".//bpmn:task", ns)
-    user_tasks = root.findall(".//bpmn:userTask", ns)
-    service_tasks = root.findall(".//bpmn:serviceTask", ns)
-    xor_gateways = root.findall(".//bpmn:exclusiveGateway", ns)
-    and_gateways = root.findall(".//bpmn:parallelGateway", ns)
-    sequence_flows = root.findall(".//bpmn:sequenceFlow", ns)
-    for se in start_events:
-        sid = se.get('id', 'start')
-        name = se.get('name', 'Start')
-        mermaid_lines.append(f"    {sid}((({name})))")
-    
-    for ee in end_events:
-        eid = ee.get('id', 'end')
-        name = ee.get('name', 'Ende')
-        mermaid_lines.append(f"    {eid}((({name})))")
-    
-    all_tasks = tasks + user_tasks + service_tasks
-    for task in all_tasks:
-        tid = task.get('id', 'task')
-        name = task.get('name', 'Task')
-        name = name.replace('"', "'")
-        mermaid_lines.append(f'    {tid}["{name}"]')
-    
-    for gw in xor_gateways:
-        gid = gw.get('id', 'gateway')
-        name = gw.get('name', 'X')
-        mermaid_lines.append(f"    {gid}{{{name}}}")
-    
-    for gw in and_gateways:
-        gid = gw.get('id', 'gateway')
-        name = gw.get('name', '+')
-        mermaid_lines.append(f"    {gid}{{{name}}}")
-    for flow in sequence_flows:
-        source = flow.get('sourceRef', '')
-        target = flow.get('targetRef', '')
-        name = flow.get('name', '')
-        if source and target:
-            if name:
-                mermaid_lines.append(f"    {source} -->|{name}| {target}")
-            else:
-                mermaid_lines.append(f"    {source} --> {target}")
-    
-    return "\n".join(mermaid_lines)
@@ -1,29 +1,55 @@
 """Database module for storing BPMN generation results"""
 
 import os
-import json
+import copy
+import sys
+import time
 import logging
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from dotenv import load_dotenv
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 
-# Load environment variables
-load_dotenv()
+from .db_pool import DATABASE_URL, get_async_pool, get_pool
 
 logger = logging.getLogger(__name__)
 
-# Database connection URL
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Stats change slowly; repeated dashboard polls within this window are served from memory
+STATS_CACHE_TTL_SECONDS = 30
+_stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+_stats_version = 0
+_stats_cache_lock = threading.Lock()
+
+# %b sends the large chat_history (Jsonb) and bpmn_xml parameters in binary format
+INSERT_GENERATION_SQL = """
+INSERT INTO bpmn_generations 
+(process_type, ai_model, chat_history, interview_summary, bpmn_xml, generation_duration_seconds)
+VALUES (%s, %s, %b, %s, %b, %s)
+RETURNING id;
+"""
+
+SELECT_GENERATION_BY_ID_SQL = """
+SELECT id, created_at, process_type, ai_model, chat_history, 
+       interview_summary, bpmn_xml, generation_duration_seconds
+FROM bpmn_generations
+WHERE id = %s;
+"""
+
+
+def invalidate_stats_cache():
+    """Drop cached stats so the next get_generation_stats call queries the database"""
+    global _stats_cache, _stats_version
+    with _stats_cache_lock:
+        _stats_version += 1
+        _stats_cache = None
 
 
 def get_connection():
-    """Create a database connection"""
-    if not DATABASE_URL:
-        raise ValueError("DATABASE_URL not set in environment variables")
-    return psycopg2.connect(DATABASE_URL)
+    """Borrow a pooled connection; commits on success and returns it to the pool afterwards"""
+    return get_pool().connection()
 
 
 def init_database():
@@ -32,26 +58,81 @@ def init_database():
     CREATE TABLE IF NOT EXISTS bpmn_generations (
         id SERIAL PRIMARY KEY,
         created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-        process_type VARCHAR(255),
-        ai_model VARCHAR(100),
+        process_type TEXT,
+        ai_model TEXT,
         chat_history JSONB,
         interview_summary TEXT,
         bpmn_xml TEXT,
         generation_duration_seconds FLOAT
     );
     
-    CREATE INDEX IF NOT EXISTS idx_bpmn_generations_created_at 
-    ON bpmn_generations(created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_bpmn_generations_created_at_id 
+    ON bpmn_generations(created_at DESC, id DESC);
+    
+    DROP INDEX IF EXISTS idx_bpmn_generations_created_at;
+    
+    -- Covering index: the process type distribution is answered by an index-only scan
+    CREATE INDEX IF NOT EXISTS idx_bpmn_generations_process_type_covering 
+    ON bpmn_generations(process_type) INCLUDE (id);
+    
+    DROP INDEX IF EXISTS idx_bpmn_generations_process_type;
+    
+    CREATE INDEX IF NOT EXISTS idx_bpmn_chat_history_gin 
+    ON bpmn_generations USING GIN (chat_history jsonb_path_ops);
+    
+    -- Older schemas used VARCHAR(n); summary_tsv depends on process_type and is re-added below
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'bpmn_generations'
+              AND column_name IN ('process_type', 'ai_model')
+              AND data_type = 'character varying'
+        ) THEN
+            ALTER TABLE bpmn_generations DROP COLUMN IF EXISTS summary_tsv;
+            ALTER TABLE bpmn_generations
+                ALTER COLUMN process_type TYPE TEXT,
+                ALTER COLUMN ai_model TYPE TEXT;
+        END IF;
+    END $$;
+    
+    ALTER TABLE bpmn_generations ADD COLUMN IF NOT EXISTS summary_tsv tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('german', coalesce(interview_summary, '') || ' ' || coalesce(process_type, ''))
+    ) STORED;
     
-    CREATE INDEX IF NOT EXISTS idx_bpmn_generations_process_type 
-    ON bpmn_generations(process_type);
+    -- LZ4 decompresses TOASTed values faster than the default pglz (PostgreSQL 14+,
+    -- server built with lz4); existing rows keep pglz until they are rewritten
+    DO $$
+    BEGIN
+        IF current_setting('server_version_num')::int >= 140000 THEN
+            EXECUTE 'ALTER TABLE bpmn_generations
+                ALTER COLUMN bpmn_xml SET COMPRESSION lz4,
+                ALTER COLUMN interview_summary SET COMPRESSION lz4';
+        END IF;
+    EXCEPTION WHEN feature_not_supported THEN
+        RAISE NOTICE 'lz4 compression not available, keeping pglz';
+    END $$;
+    """
+    
+    # CONCURRENTLY cannot run inside a transaction block
+    create_search_index_sql = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bpmn_generations_summary_tsv 
+    ON bpmn_generations USING GIN (summary_tsv);
     """
     
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(create_table_sql)
-            conn.commit()
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL not set in environment variables")
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            # Advisory lock so that concurrently starting workers run the DDL only once
+            conn.execute("SELECT pg_advisory_lock(hashtext('bpmn_init'))")
+            try:
+                with conn.transaction():
+                    conn.execute(create_table_sql)
+                conn.execute(create_search_index_sql)
+            finally:
+                conn.execute("SELECT pg_advisory_unlock(hashtext('bpmn_init'))")
         logger.info("Database initialized successfully")
         return True
     except Exception as e:
@@ -81,26 +162,20 @@ def save_bpmn_generation(
     Returns:
         The ID of the inserted record, or None if failed
     """
-    insert_sql = """
-    INSERT INTO bpmn_generations 
-    (process_type, ai_model, chat_history, interview_summary, bpmn_xml, generation_duration_seconds)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    RETURNING id;
-    """
-    
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(insert_sql, (
+                cur.execute(INSERT_GENERATION_SQL, (
                     process_type,
                     ai_model,
-                    json.dumps(chat_history, ensure_ascii=False),
+                    Jsonb(chat_history),
                     interview_summary,
                     bpmn_xml,
                     generation_duration_seconds
                 ))
                 record_id = cur.fetchone()[0]
             conn.commit()
+        invalidate_stats_cache()
         logger.info(f"BPMN generation saved with ID: {record_id}")
         return record_id
     except Exception as e:
@@ -108,28 +183,89 @@ def save_bpmn_generation(
         return None
 
 
-def get_all_generations(limit: int = 100) -> List[Dict[str, Any]]:
+def save_bpmn_generations_bulk(records: List[Tuple]) -> List[int]:
     """
-    Get all BPMN generation records
+    Save several BPMN generation records in one batch
     
     Args:
-        limit: Maximum number of records to return
+        records: Tuples of (process_type, ai_model, chat_history, interview_summary,
+            bpmn_xml, generation_duration_seconds)
         
     Returns:
-        List of generation records
+        The IDs of the inserted records in input order, or an empty list if failed
     """
+    if not records:
+        return []
+    rows = [
+        (process_type, ai_model, Jsonb(chat_history), interview_summary, bpmn_xml, duration)
+        for process_type, ai_model, chat_history, interview_summary, bpmn_xml, duration in records
+    ]
+    
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                # executemany runs in pipeline mode: one round-trip for the whole batch
+                cur.executemany(INSERT_GENERATION_SQL, rows, returning=True)
+                record_ids = []
+                while True:
+                    record_ids.append(cur.fetchone()[0])
+                    if not cur.nextset():
+                        break
+            conn.commit()
+        invalidate_stats_cache()
+        logger.info(f"Saved {len(record_ids)} BPMN generations")
+        return record_ids
+    except Exception as e:
+        logger.error(f"Error saving BPMN generations in bulk: {e}")
+        return []
+
+
+def _generations_query(
+    limit: Optional[int],
+    before: Optional[Tuple[datetime, int]],
+    include_xml: bool = False
+) -> Tuple[str, tuple]:
+    """Build the listing query; LIMIT NULL returns all rows"""
+    # Leaving out bpmn_xml spares the server from de-TOASTing every diagram in the page
+    xml_column = "bpmn_xml, " if include_xml else ""
+    # Keyset pagination: seeks directly in the (created_at, id) index instead of skipping an OFFSET
     select_sql = """
     SELECT id, created_at, process_type, ai_model, chat_history, 
-           interview_summary, bpmn_xml, generation_duration_seconds
+           interview_summary, {xml_column}generation_duration_seconds
     FROM bpmn_generations
-    ORDER BY created_at DESC
-    LIMIT %s;
+    {where}
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+    """
+    
+    if before is None:
+        return select_sql.format(xml_column=xml_column, where=""), (limit,)
+    where = "WHERE (created_at, id) < (%s, %s)"
+    return select_sql.format(xml_column=xml_column, where=where), (before[0], before[1], limit)
+
+
+def get_all_generations(
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None,
+    include_xml: bool = False
+) -> List[Dict[str, Any]]:
     """
+    Get all BPMN generation records, newest first
+    
+    Args:
+        limit: Maximum number of records to return
+        before: Page cursor from next_page_cursor(); only records older than it are returned
+        include_xml: Also fetch bpmn_xml; use get_generation_by_id for a single diagram
+        
+    Returns:
+        List of generation records
+    """
+    query, params = _generations_query(limit, before, include_xml)
     
     try:
         with get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(select_sql, (limit,))
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(query, params)
                 records = cur.fetchall()
         return [dict(r) for r in records]
     except Exception as e:
@@ -137,6 +273,55 @@ def get_all_generations(limit: int = 100) -> List[Dict[str, Any]]:
         return []
 
 
+def iter_generations(
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    include_xml: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream BPMN generation records, newest first, through a server-side cursor
+    
+    Rows are fetched from the server in batches of 100, so only one batch of
+    bpmn_xml payloads is held in memory at a time. The pooled connection stays
+    checked out until the generator is exhausted or closed.
+    
+    Args:
+        limit: Maximum number of records to return, or None for all
+        before: Page cursor from next_page_cursor(); only records older than it are returned
+        include_xml: Also fetch bpmn_xml
+        
+    Yields:
+        Generation records
+    """
+    query, params = _generations_query(limit, before, include_xml)
+    
+    try:
+        with get_connection() as conn:
+            with conn.cursor(name="bpmn_generations_iter", row_factory=dict_row) as cur:
+                cur.itersize = 100
+                cur.execute(query, params)
+                for record in cur:
+                    yield dict(record)
+    except Exception as e:
+        logger.error(f"Error streaming BPMN generations: {e}")
+
+
+def next_page_cursor(records: List[Dict[str, Any]]) -> Optional[Tuple[datetime, int]]:
+    """
+    Build the cursor for the page following the given records
+    
+    Args:
+        records: A page returned by get_all_generations
+        
+    Returns:
+        The ``before`` value for the next page, or None if the page was empty
+    """
+    if not records:
+        return None
+    last = records[-1]
+    return last["created_at"], last["id"]
+
+
 def get_generation_by_id(generation_id: int) -> Optional[Dict[str, Any]]:
     """
     Get a specific BPMN generation record by ID
@@ -147,65 +332,214 @@ def get_generation_by_id(generation_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         The generation record, or None if not found
     """
+    try:
+        with get_connection() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(SELECT_GENERATION_BY_ID_SQL, (generation_id,))
+                record = cur.fetchone()
+        return dict(record) if record else None
+    except Exception as e:
+        logger.error(f"Error fetching BPMN generation {generation_id}: {e}")
+        return None
+
+
+async def save_bpmn_generation_async(
+    process_type: str,
+    ai_model: str,
+    chat_history: List[Dict[str, Any]],
+    interview_summary: str,
+    bpmn_xml: str,
+    generation_duration_seconds: Optional[float] = None
+) -> Optional[int]:
+    """
+    Save a BPMN generation record without blocking the event loop
+    
+    Same arguments and return value as save_bpmn_generation, but runs on the
+    async connection pool.
+    """
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(INSERT_GENERATION_SQL, (
+                    process_type,
+                    ai_model,
+                    Jsonb(chat_history),
+                    interview_summary,
+                    bpmn_xml,
+                    generation_duration_seconds
+                ))
+                record_id = (await cur.fetchone())[0]
+        invalidate_stats_cache()
+        logger.info(f"BPMN generation saved with ID: {record_id}")
+        return record_id
+    except Exception as e:
+        logger.error(f"Error saving BPMN generation: {e}")
+        return None
+
+
+async def get_all_generations_async(
+    limit: int = 100,
+    before: Optional[Tuple[datetime, int]] = None,
+    include_xml: bool = False
+) -> List[Dict[str, Any]]:
+    """Async variant of get_all_generations for use in event handlers"""
+    query, params = _generations_query(limit, before, include_xml)
+    
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(query, params)
+                records = await cur.fetchall()
+        return [dict(r) for r in records]
+    except Exception as e:
+        logger.error(f"Error fetching BPMN generations: {e}")
+        return []
+
+
+async def get_generation_by_id_async(generation_id: int) -> Optional[Dict[str, Any]]:
+    """Async variant of get_generation_by_id for use in event handlers"""
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(SELECT_GENERATION_BY_ID_SQL, (generation_id,))
+                record = await cur.fetchone()
+        return dict(record) if record else None
+    except Exception as e:
+        logger.error(f"Error fetching BPMN generation {generation_id}: {e}")
+        return None
+
+
+def search_by_chat_content(fragment: Dict[str, Any], limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Find BPMN generations whose chat history contains a matching message
+    
+    Args:
+        fragment: Key/value pairs a single chat message must contain,
+            e.g. {"role": "assistant", "title": "Interview abgeschlossen"}
+        limit: Maximum number of records to return
+        
+    Returns:
+        List of matching generation records, newest first
+    """
+    # Containment on the JSONB array lets the planner use the GIN index
     select_sql = """
     SELECT id, created_at, process_type, ai_model, chat_history, 
            interview_summary, bpmn_xml, generation_duration_seconds
     FROM bpmn_generations
-    WHERE id = %s;
+    WHERE chat_history @> %s
+    ORDER BY created_at DESC
+    LIMIT %s;
     """
     
     try:
         with get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(select_sql, (generation_id,))
-                record = cur.fetchone()
-        return dict(record) if record else None
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(select_sql, (Jsonb([fragment]), limit))
+                records = cur.fetchall()
+        return [dict(r) for r in records]
     except Exception as e:
-        logger.error(f"Error fetching BPMN generation {generation_id}: {e}")
-        return None
+        logger.error(f"Error searching BPMN generations by chat content: {e}")
+        return []
+
+
+def search_generations(query: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Full-text search over interview summaries and process types
+    
+    Args:
+        query: Search terms in plain German text
+        limit: Maximum number of records to return
+        
+    Returns:
+        List of matching generation records, best match first
+    """
+    select_sql = """
+    SELECT id, created_at, process_type, ai_model, chat_history, 
+           interview_summary, bpmn_xml, generation_duration_seconds
+    FROM bpmn_generations, plainto_tsquery('german', %s) AS query
+    WHERE summary_tsv @@ query
+    ORDER BY ts_rank(summary_tsv, query) DESC, created_at DESC
+    LIMIT %s;
+    """
+    
+    try:
+        with get_connection() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(select_sql, (query, limit))
+                records = cur.fetchall()
+        return [dict(r) for r in records]
+    except Exception as e:
+        logger.error(f"Error searching BPMN generations: {e}")
+        return []
 
 
 def get_generation_stats() -> Dict[str, Any]:
     """
-    Get statistics about BPMN generations
+    Get statistics about BPMN generations, cached for STATS_CACHE_TTL_SECONDS
     
     Returns:
         Dictionary with stats
     """
+    global _stats_cache
+    with _stats_cache_lock:
+        cached = _stats_cache
+        version = _stats_version
+    if cached is not None and time.monotonic() - cached[0] < STATS_CACHE_TTL_SECONDS:
+        # Deep copy: the nested process type distribution must not alias the cached value
+        return copy.deepcopy(cached[1])
+    
+    # One statement, one row: the distribution is aggregated server-side into a JSONB array
     stats_sql = """
     SELECT 
         COUNT(*) as total_generations,
         COUNT(DISTINCT process_type) as unique_process_types,
         AVG(generation_duration_seconds) as avg_duration_seconds,
         MIN(created_at) as first_generation,
-        MAX(created_at) as last_generation
+        MAX(created_at) as last_generation,
+        (
+            SELECT COALESCE(
+                jsonb_agg(jsonb_build_object('process_type', process_type, 'count', count) ORDER BY count DESC),
+                '[]'::jsonb
+            )
+            FROM (
+                SELECT process_type, COUNT(*) as count
+                FROM bpmn_generations
+                GROUP BY process_type
+            ) as distribution
+        ) as process_type_distribution
     FROM bpmn_generations;
     """
     
-    process_type_sql = """
-    SELECT process_type, COUNT(*) as count
-    FROM bpmn_generations
-    GROUP BY process_type
-    ORDER BY count DESC;
-    """
-    
     try:
         with get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with conn.cursor(row_factory=dict_row) as cur:
                 cur.execute(stats_sql)
                 stats = dict(cur.fetchone())
                 
-                cur.execute(process_type_sql)
-                stats['process_type_distribution'] = [dict(r) for r in cur.fetchall()]
-                
-        return stats
+        with _stats_cache_lock:
+            # A save during the query bumped the version; don't cache the stale result
+            if version == _stats_version:
+                _stats_cache = (time.monotonic(), stats)
+        return copy.deepcopy(stats)
     except Exception as e:
         logger.error(f"Error fetching stats: {e}")
         return {}
 
 
-# Initialize database on module import
-try:
-    init_database()
-except Exception as e:
-    logger.warning(f"Could not initialize database on import: {e}")
+# Schema setup runs once via `python -m LLM4BPMN_reflex.db init`;
+# set DB_AUTO_INIT=1 to run it on import instead
+if os.getenv("DB_AUTO_INIT") == "1":
+    try:
+        init_database()
+    except Exception as e:
+        logger.warning(f"Could not initialize database on import: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["init"]:
+        sys.exit("Usage: python -m LLM4BPMN_reflex.db init")
+    sys.exit(0 if init_database() else 1)
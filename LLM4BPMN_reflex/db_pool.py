@@ -0,0 +1,116 @@
+"""Process-wide PostgreSQL connection pool"""
+
+import os
+import atexit
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Database connection URL
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+_async_pool: Optional[AsyncConnectionPool] = None
+_async_pool_lock: Optional[asyncio.Lock] = None
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Get the shared connection pool, creating it on first use
+    
+    Connections are health-checked before being handed out, recycled after
+    30 minutes and idle connections above ``min_size`` are closed after
+    5 minutes.
+    
+    Returns:
+        The process-wide connection pool
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not set in environment variables")
+    with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool(
+                DATABASE_URL,
+                min_size=1,
+                max_size=8,
+                timeout=10,
+                max_lifetime=1800,
+                max_idle=300,
+                check=ConnectionPool.check_connection,
+                kwargs={"prepare_threshold": 5},
+                open=True,
+            )
+            atexit.register(pool.close)
+            logger.info("Database connection pool opened")
+            _pool = pool
+    return _pool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    Get the shared async connection pool, opening it on first use
+    
+    Used from Reflex event handlers so that concurrent users' queries
+    interleave on the event loop instead of each occupying a worker thread.
+    Must be called from the application's event loop.
+    
+    Returns:
+        The process-wide async connection pool
+    """
+    global _async_pool, _async_pool_lock
+    if _async_pool is not None:
+        return _async_pool
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not set in environment variables")
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    async with _async_pool_lock:
+        if _async_pool is None:
+            pool = AsyncConnectionPool(
+                DATABASE_URL,
+                min_size=2,
+                max_size=20,
+                timeout=10,
+                max_lifetime=1800,
+                max_idle=300,
+                check=AsyncConnectionPool.check_connection,
+                kwargs={"prepare_threshold": 5},
+                open=False,
+            )
+            await pool.open()
+            logger.info("Async database connection pool opened")
+            _async_pool = pool
+    return _async_pool
+
+
+@asynccontextmanager
+async def async_pool_lifespan() -> AsyncIterator[None]:
+    """App lifespan task: opens the async pool at startup and closes it on shutdown"""
+    global _async_pool
+    if DATABASE_URL:
+        try:
+            await get_async_pool()
+        except Exception as e:
+            logger.warning(f"Could not open async database pool: {e}")
+    try:
+        yield
+    finally:
+        if _async_pool is not None:
+            await _async_pool.close()
+            _async_pool = None
+            logger.info("Async database connection pool closed")
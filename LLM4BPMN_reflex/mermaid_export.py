@@ -0,0 +1,90 @@
+# Mermaid-Export für generierte BPMN-Modelle.
+#
+# Das Modul ist vollständig annotiert und lässt sich optional mit mypyc
+# kompilieren (``mypyc LLM4BPMN_reflex/mermaid_export.py``). Die erzeugte
+# Erweiterung liegt neben dieser Datei und wird beim Import bevorzugt; ohne
+# Build wird diese Python-Datei verwendet.
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional
+
+from .bpmn_generator import ET, parse_xml, qualified_tag
+
+MERMAID_PARSE_ERROR = "graph TD\n    Error[Fehler beim Parsen]"
+MERMAID_LABEL_ESCAPES: Dict[int, str] = str.maketrans({'"': "'", '\n': ' ', '|': '/', '[': '(', ']': ')'})
+
+MERMAID_EVENT_LINE: Callable[..., str] = "    {0}((({1})))".format
+MERMAID_TASK_LINE: Callable[..., str] = '    {0}["{1}"]'.format
+MERMAID_GATEWAY_LINE: Callable[..., str] = "    {0}{{{1}}}".format
+MERMAID_LABELED_FLOW_LINE: Callable[..., str] = "    {0} -->|{2}| {1}".format
+MERMAID_FLOW_LINE: Callable[..., str] = "    {0} --> {1}".format
+
+
+def _mermaid_label(el: Any, default: str) -> str:
+    name: str = el.get('name', default)
+    return name.translate(MERMAID_LABEL_ESCAPES)
+
+
+def _mermaid_start_event(el: Any) -> Optional[str]:
+    return MERMAID_EVENT_LINE(el.get('id', 'start'), _mermaid_label(el, 'Start'))
+
+
+def _mermaid_end_event(el: Any) -> Optional[str]:
+    return MERMAID_EVENT_LINE(el.get('id', 'end'), _mermaid_label(el, 'Ende'))
+
+
+def _mermaid_task(el: Any) -> Optional[str]:
+    return MERMAID_TASK_LINE(el.get('id', 'task'), _mermaid_label(el, 'Task'))
+
+
+def _mermaid_xor_gateway(el: Any) -> Optional[str]:
+    return MERMAID_GATEWAY_LINE(el.get('id', 'gateway'), _mermaid_label(el, 'X'))
+
+
+def _mermaid_and_gateway(el: Any) -> Optional[str]:
+    return MERMAID_GATEWAY_LINE(el.get('id', 'gateway'), _mermaid_label(el, '+'))
+
+
+def _mermaid_sequence_flow(el: Any) -> Optional[str]:
+    source: str = el.get('sourceRef', '')
+    target: str = el.get('targetRef', '')
+    if not (source and target):
+        return None
+    name = _mermaid_label(el, '')
+    if name:
+        return MERMAID_LABELED_FLOW_LINE(source, target, name)
+    return MERMAID_FLOW_LINE(source, target)
+
+
+# Reihenfolge der Einträge bestimmt die Reihenfolge der Abschnitte im Diagramm
+MERMAID_EMITTERS: Dict[str, Callable[[Any], Optional[str]]] = {
+    qualified_tag("startEvent"): _mermaid_start_event,
+    qualified_tag("endEvent"): _mermaid_end_event,
+    qualified_tag("task"): _mermaid_task,
+    qualified_tag("userTask"): _mermaid_task,
+    qualified_tag("serviceTask"): _mermaid_task,
+    qualified_tag("exclusiveGateway"): _mermaid_xor_gateway,
+    qualified_tag("parallelGateway"): _mermaid_and_gateway,
+    qualified_tag("sequenceFlow"): _mermaid_sequence_flow,
+}
+
+
+def bpmn_to_mermaid(bpmn_xml: str, root: Any = None) -> str:
+    if root is None:
+        try:
+            root = parse_xml(bpmn_xml)
+        except ET.ParseError:
+            return MERMAID_PARSE_ERROR
+
+    sections: Dict[str, List[str]] = {tag: [] for tag in MERMAID_EMITTERS}
+    for el in root.iter():
+        tag = el.tag
+        # lxml liefert für Kommentare und Processing Instructions keine str-Tags
+        if not isinstance(tag, str):
+            continue
+        emit = MERMAID_EMITTERS.get(tag)
+        if emit is not None:
+            line = emit(el)
+            if line:
+                sections[tag].append(line)
+
+    return "\n".join(chain(("graph TD",), *sections.values()))
@@ -1,14 +1,32 @@
 """Prompt Loader - Lädt Prompts aus dem prompts Ordner"""
 
 import os
+import re
 from pathlib import Path
 from functools import lru_cache
 
 # Pfad zum prompts Ordner
 PROMPTS_DIR = Path(__file__).parent / "prompts"
 
+# Platzhalter im Format {name}; JSON-Beispiele wie {"flagged": ...} passen nicht
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+
+def _read_prompts() -> dict:
+    return {path.stem: path.read_text(encoding="utf-8") for path in PROMPTS_DIR.glob("*.txt")}
+
+
+# Alle Prompts werden beim Import einmalig gelesen
+PROMPTS = _read_prompts()
+
+
+def reload_prompts() -> None:
+    """Liest alle Prompts neu ein (z.B. nach Änderungen während der Entwicklung)"""
+    global PROMPTS
+    PROMPTS = _read_prompts()
+    _load_template.cache_clear()
+
 
-@lru_cache(maxsize=None)
 def load_prompt(prompt_name: str) -> str:
     """
     Lädt einen Prompt aus einer Textdatei.
@@ -22,13 +40,25 @@ def load_prompt(prompt_name: str) -> str:
     Raises:
         FileNotFoundError: Wenn die Prompt-Datei nicht existiert
     """
-    prompt_path = PROMPTS_DIR / f"{prompt_name}.txt"
-    
-    if not prompt_path.exists():
-        raise FileNotFoundError(f"Prompt '{prompt_name}' nicht gefunden: {prompt_path}")
+    try:
+        return PROMPTS[prompt_name]
+    except KeyError:
+        prompt_path = PROMPTS_DIR / f"{prompt_name}.txt"
+        raise FileNotFoundError(f"Prompt '{prompt_name}' nicht gefunden: {prompt_path}") from None
+
+
+@lru_cache(maxsize=64)
+def _load_template(prompt_name: str) -> tuple:
+    """
+    Zerlegt einen Prompt einmalig in Textstücke und Platzhalter.
     
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read()
+    Gerade Indizes sind Literale, ungerade Indizes Platzhalternamen,
+    sodass beim Rendern nur noch ein join über die Stücke nötig ist.
+    """
+    text = load_prompt(prompt_name)
+    parts = tuple(PLACEHOLDER_PATTERN.split(text))
+    names = tuple(dict.fromkeys(parts[1::2]))
+    return text, parts, names
 
 
 def format_prompt(prompt_name: str, **kwargs) -> str:
@@ -42,12 +72,18 @@ def format_prompt(prompt_name: str, **kwargs) -> str:
     Returns:
         Der formatierte Prompt-Text
     """
-    template = load_prompt(prompt_name)
-    
-    result = template
-    for key, value in kwargs.items():
-        result = result.replace("{" + key + "}", str(value) if value else "")
-    return result
+    text, parts, names = _load_template(prompt_name)
+    if not names:
+        return text
+
+    # Unbekannte Platzhalter bleiben als {name} stehen, leere Werte werden zu ""
+    values = {
+        key: (str(kwargs[key]) if kwargs[key] else "") if key in kwargs else f"{{{key}}}"
+        for key in names
+    }
+    rendered = list(parts)
+    rendered[1::2] = [values[key] for key in parts[1::2]]
+    return "".join(rendered)
 
 
 # Verfügbare Prompts als Konstanten für einfachen Zugriff
@@ -65,6 +101,4 @@ class Prompts:
 
 def list_available_prompts() -> list:
     """Listet alle verfügbaren Prompts auf"""
-    if not PROMPTS_DIR.exists():
-        return []
-    return [f.stem for f in PROMPTS_DIR.glob("*.txt")]
+    return list(PROMPTS)
@@ -0,0 +1,60 @@
+from LLM4BPMN_reflex.bpmn_generator import BPMNGenerator, parse_xml, BPMN_DI_DIAGRAM_TAG
+
+
+DIAGRAM = """<bpmndi:BPMNDiagram id="BPMNDiagram_1">
+  <bpmndi:BPMNPlane id="BPMNPlane_1" bpmnElement="Process_1">
+    <bpmndi:BPMNShape id="StartEvent_1_di" bpmnElement="StartEvent_1">
+      <dc:Bounds x="100" y="100" width="36" height="36" />
+    </bpmndi:BPMNShape>
+    <bpmndi:BPMNShape id="EndEvent_1_di" bpmnElement="EndEvent_1">
+      <dc:Bounds x="300" y="100" width="36" height="36" />
+    </bpmndi:BPMNShape>
+    <bpmndi:BPMNEdge id="Flow_1_di" bpmnElement="Flow_1">
+      <di:waypoint x="136" y="118" />
+      <di:waypoint x="300" y="118" />
+    </bpmndi:BPMNEdge>
+  </bpmndi:BPMNPlane>
+</bpmndi:BPMNDiagram>"""
+
+PROCESS = """
+  <bpmn:process id="Process_1" isExecutable="false">
+    <bpmn:startEvent id="StartEvent_1" />
+    <bpmn:endEvent id="EndEvent_1" />
+    <bpmn:sequenceFlow id="Flow_1" sourceRef="StartEvent_1" targetRef="EndEvent_1" />
+  </bpmn:process>
+</bpmn:definitions>"""
+
+BPMN_ONLY_ROOT = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL" id="Definitions_1">"""
+
+FULL_ROOT = """<?xml version="1.0" encoding="UTF-8"?>
+<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL"
+  xmlns:bpmndi="http://www.omg.org/spec/BPMN/20100524/DI"
+  xmlns:dc="http://www.omg.org/spec/DD/20100524/DC"
+  xmlns:di="http://www.omg.org/spec/DD/20100524/DI" id="Definitions_1">"""
+
+
+def test_merge_without_di_namespaces_on_root():
+    generator = BPMNGenerator(client=None)
+    merged = generator.merge_bpmn_xml_diagram(BPMN_ONLY_ROOT + PROCESS, DIAGRAM)
+
+    root = parse_xml(merged)
+    assert len(root.findall(BPMN_DI_DIAGRAM_TAG)) == 1
+    assert generator.check_xml_completeness(merged) == []
+
+
+def test_merge_with_di_namespaces_on_root():
+    generator = BPMNGenerator(client=None)
+    merged = generator.merge_bpmn_xml_diagram(FULL_ROOT + PROCESS, DIAGRAM)
+
+    root = parse_xml(merged)
+    assert len(root.findall(BPMN_DI_DIAGRAM_TAG)) == 1
+    assert generator.check_xml_completeness(merged) == []
+
+
+def test_merge_keeps_model_when_diagram_is_malformed():
+    generator = BPMNGenerator(client=None)
+    bpmn_xml = FULL_ROOT + PROCESS
+    merged = generator.merge_bpmn_xml_diagram(bpmn_xml, DIAGRAM.replace("</bpmndi:BPMNPlane>", ""))
+
+    assert merged == bpmn_xml